@@ -0,0 +1,408 @@
+# benchmark.py
+"""
+Benchmarks sintéticos de los caminos calientes de procesamiento y metadatos.
+
+Genera un dataset de prueba (videos cortos con una mancha en movimiento, fotos con
+EXIF DateTimeOriginal en ráfagas y consolidados JSON de 10k-200k entradas), cronometra
+procesar_video, escanear_videos, procesar_grupo_de_fotos, filter_videos,
+DynamicTagger.update_consolidated_metadata y AnalysisGUI._build_dataframe, y guarda
+un reporte JSON que una corrida posterior puede comparar (--comparar).
+
+Uso:
+  python benchmark.py [--dir CARPETA] [--videos N] [--fotos M] [--entradas 10000,50000,200000]
+                      [--repeticiones R] [--salida reporte.json] [--comparar previo.json]
+Los parámetros de Processing (SCAN_MODE, FRAME_BACKEND, ...) son los de config.ini.
+"""
+import os
+import json
+import time
+import struct
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import cv2
+
+BENCHMARK_VERSION = 1
+
+# Valores para las entradas sintéticas del consolidado
+ESPECIES = ["puma", "zorro", "guanaco", "liebre", "chingue", "huemul", "pudu", "ave", "humano", "vacio"]
+COMPORTAMIENTOS = ["camina", "corre", "come", "descansa", "olfatea", "marca"]
+SITIOS = [f"sitio_{i:02d}" for i in range(12)]
+CAMARAS = [f"CAM{i:03d}" for i in range(40)]
+OPERADORES = ["ana", "bruno", "carla", "diego", "elena"]
+
+
+# ---------------------------
+# Generador del dataset
+# ---------------------------
+def _fondo_sintetico(rng, w, h):
+    """Fondo con textura suave y algo de ruido, para que el promedio no sea trivial."""
+    base = cv2.resize(rng.integers(40, 200, (h // 16 + 1, w // 16 + 1, 3), dtype=np.uint8),
+                      (w, h), interpolation=cv2.INTER_CUBIC)
+    return base
+
+
+def _dibujar_mancha(img, t, w, h, radio):
+    """Mancha que cruza el cuadro en diagonal; t en [0, 1]."""
+    cx = int(radio + t * (w - 2 * radio))
+    cy = int(h / 2 + (h / 3) * np.sin(2 * np.pi * t))
+    cv2.circle(img, (cx, cy), radio, (30, 30, 30), -1)
+    cv2.circle(img, (cx - radio // 3, cy - radio // 3), radio // 3, (220, 220, 220), -1)
+
+
+def generar_videos(carpeta, n, segundos=20, fps=10, size=(640, 360), seed=0):
+    """
+    Escribe `n` videos .mp4 con cv2.VideoWriter. La mancha aparece solo en la mitad central
+    del video, así el fondo y los tops tienen algo que separar. Devuelve las rutas.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    w, h = size
+    total = segundos * fps
+    paths = []
+    for i in range(n):
+        path = os.path.join(carpeta, f"VID_{i:04d}.mp4")
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+        if not writer.isOpened():
+            raise IOError(f"cv2.VideoWriter no pudo abrir {path}")
+        fondo = _fondo_sintetico(rng, w, h)
+        frame = np.empty_like(fondo)
+        for k in range(total):
+            ruido = rng.integers(-6, 7, (h, w, 1), dtype=np.int16)
+            frame[:] = np.clip(fondo.astype(np.int16) + ruido, 0, 255).astype(np.uint8)
+            t = k / total
+            if 0.25 <= t < 0.75:
+                _dibujar_mancha(frame, (t - 0.25) * 2, w, h, radio=h // 8)
+            writer.write(frame)
+        writer.release()
+        paths.append(path)
+    return paths
+
+
+def _segmento_exif(fecha):
+    """APP1 mínimo con IFD0 -> Exif IFD -> DateTimeOriginal (little-endian)."""
+    valor = fecha.strftime("%Y:%m:%d %H:%M:%S").encode("ascii") + b"\x00"
+    tiff = b"II*\x00" + struct.pack("<I", 8)
+    # IFD0 (offset 8): una entrada ExifIFDPointer que apunta al Exif IFD en 26
+    tiff += struct.pack("<H", 1) + struct.pack("<HHII", 0x8769, 4, 1, 26) + struct.pack("<I", 0)
+    # Exif IFD (offset 26): DateTimeOriginal, ASCII de 20 bytes guardado en 44
+    tiff += struct.pack("<H", 1) + struct.pack("<HHII", 0x9003, 2, len(valor), 44) + struct.pack("<I", 0)
+    tiff += valor
+    payload = b"Exif\x00\x00" + tiff
+    return b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+
+
+def generar_fotos(carpeta, m, inicio, rafaga=3, size=(1280, 720), seed=1):
+    """
+    Escribe `m` JPEG en ráfagas de `rafaga` fotos (1 s entre fotos, 1 min entre ráfagas)
+    con la mancha moviéndose dentro de cada ráfaga. La fecha va en EXIF y en el mtime.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    w, h = size
+    paths = []
+    fondo = None
+    for i in range(m):
+        k = i % rafaga
+        if k == 0:
+            fondo = _fondo_sintetico(rng, w, h)
+        img = fondo.copy()
+        _dibujar_mancha(img, (k + 1) / (rafaga + 1), w, h, radio=h // 10)
+        fecha = inicio + timedelta(minutes=i // rafaga, seconds=k)
+        ok, jpg = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), 90])
+        if not ok:
+            raise IOError("cv2.imencode falló")
+        data = jpg.tobytes()
+        path = os.path.join(carpeta, f"IMG_{i:04d}.JPG")
+        with open(path, "wb") as f:
+            f.write(data[:2] + _segmento_exif(fecha) + data[2:])
+        ts = fecha.timestamp()
+        os.utime(path, (ts, ts))
+        paths.append(path)
+    return paths
+
+
+def generar_entradas(n, seed=2):
+    """Lista de `n` entradas con la forma de all_sessions_metadata.json."""
+    rnd = random.Random(seed)
+    base = datetime(2024, 1, 1)
+    sesiones = [f"{(base + timedelta(days=7 * s)):%y%m%d}_120000_{s:06X}" for s in range(max(1, n // 500))]
+    entradas = []
+    for i in range(n):
+        grabado = base + timedelta(seconds=rnd.randrange(0, 365 * 86400))
+        v_hash = f"{rnd.getrandbits(64):016x}"
+        prefijo = grabado.strftime("%y%m%d_%H%M%S")
+        carpeta = os.path.join("output", "frames", v_hash)
+        entradas.append({
+            "video_path": os.path.join("input", f"VID_{i:07d}.MP4"),
+            "video_hash": v_hash,
+            "frames_folder": v_hash,
+            "fecha_prefix": prefijo,
+            "associated_photos": [],
+            "original_photos": [],
+            "promedio": os.path.join(carpeta, f"{prefijo}_promedio.jpg"),
+            "mask": os.path.join(carpeta, f"{prefijo}_mask.jpg"),
+            "tops": [os.path.join(carpeta, f"{prefijo}_top_{k:02d}.jpg") for k in range(1, 7)],
+            "tags": rnd.sample(ESPECIES, rnd.choice([0, 1, 1, 1, 2])),
+            "behaviors": rnd.sample(COMPORTAMIENTOS, rnd.choice([0, 1, 2])),
+            "notes": "",
+            "status": "done",
+            "site": rnd.choice(SITIOS),
+            "subsite": "",
+            "camera": rnd.choice(CAMARAS),
+            "operator": rnd.choice(OPERADORES),
+            "recorded_at": grabado.strftime("%Y-%m-%d %H:%M:%S"),
+            "session_id": rnd.choice(sesiones),
+            "is_excluded": False,
+            "width": 1920,
+            "height": 1080,
+            "duration": 20.0,
+            "fps": 30.0,
+            "codec": "h264"
+        })
+    return entradas
+
+
+def escribir_consolidado(output_root, entradas):
+    """Escribe el consolidado igual que el tagger (indent=4). Devuelve su ruta."""
+    carpeta = os.path.join(output_root, "consolidated")
+    os.makedirs(carpeta, exist_ok=True)
+    path = os.path.join(carpeta, "all_sessions_metadata.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(entradas, f, indent=4, ensure_ascii=False)
+    return path
+
+
+# ---------------------------
+# Medición
+# ---------------------------
+def medir(fn, repeticiones=3, preparar=None):
+    """
+    Ejecuta fn() `repeticiones` veces (con preparar() antes de cada una, fuera del tiempo).
+    Devuelve {"min", "mean", "max", "runs"} en segundos.
+    """
+    tiempos = []
+    for _ in range(repeticiones):
+        if preparar is not None:
+            preparar()
+        t0 = time.perf_counter()
+        fn()
+        tiempos.append(time.perf_counter() - t0)
+    return {
+        "min": round(min(tiempos), 6),
+        "mean": round(sum(tiempos) / len(tiempos), 6),
+        "max": round(max(tiempos), 6),
+        "runs": len(tiempos)
+    }
+
+
+def _omitido(nombre, error):
+    print(f"[benchmark] {nombre}: omitido ({error})")
+    return {"skipped": str(error)}
+
+
+def entorno():
+    """Versiones y parámetros que hacen comparables (o no) dos reportes."""
+    import procesamiento
+    claves = [
+        "FPS_EXTRACT", "BUFFER_N", "TOP_K", "DOWNSAMPLE_MAX", "DECODE_MODE", "COLOR_TOPS",
+        "SCAN_MODE", "FRAME_BACKEND", "PIPELINE_QUEUE", "JPEG_THREADS", "PROXY_CACHE"
+    ]
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "processing": {k: getattr(procesamiento, k, None) for k in claves}
+    }
+
+
+# ---------------------------
+# Benchmarks
+# ---------------------------
+def bench_videos(carpeta, repeticiones):
+    """escanear_videos (con caché de sondeo vacía en cada corrida) y procesar_video por video."""
+    from procesamiento import escanear_videos, procesar_video
+
+    resultados = {}
+    raices = []
+
+    def raiz_nueva():
+        raices.append(tempfile.mkdtemp(prefix="out_", dir=carpeta))
+
+    input_folder = os.path.join(carpeta, "input")
+    resultados["escanear_videos"] = medir(
+        lambda: escanear_videos(input_folder, raices[-1]), repeticiones, preparar=raiz_nueva
+    )
+    output_root = raices[-1]
+    metas = escanear_videos(input_folder, output_root)
+    resultados["escanear_videos"]["videos"] = len(metas)
+
+    por_video = []
+    for meta in metas:
+        r = medir(lambda: procesar_video(dict(meta), output_root), repeticiones)
+        por_video.append(r["min"])
+    duracion = sum(m.get("duration") or 0.0 for m in metas)
+    resultados["procesar_video"] = {
+        "min": round(sum(por_video), 6),
+        "per_video_min": [round(t, 6) for t in por_video],
+        "videos": len(metas),
+        "video_seconds": round(duracion, 2),
+        "throughput": round(duracion / sum(por_video), 2) if por_video and sum(por_video) > 0 else None
+    }
+    for raiz in raices:
+        shutil.rmtree(raiz, ignore_errors=True)
+    return resultados
+
+
+def bench_fotos(carpeta, repeticiones):
+    """procesar_grupo_de_fotos sobre todas las ráfagas generadas."""
+    from procesamiento import obtener_fotos_con_timestamp, agrupar_en_rafagas, procesar_grupo_de_fotos
+
+    fotos = obtener_fotos_con_timestamp(os.path.join(carpeta, "input"))
+    grupos = agrupar_en_rafagas(fotos)
+    output_root = tempfile.mkdtemp(prefix="out_", dir=carpeta)
+    try:
+        r = medir(lambda: [procesar_grupo_de_fotos(g, output_root) for g in grupos], repeticiones)
+    finally:
+        shutil.rmtree(output_root, ignore_errors=True)
+    r.update({"groups": len(grupos), "photos": len(fotos)})
+    return {"procesar_grupo_de_fotos": r}
+
+
+def bench_metadatos(carpeta, tamanos, repeticiones):
+    """filter_videos, update_consolidated_metadata y _build_dataframe por tamaño de consolidado."""
+    from filter_utils import filter_videos
+
+    resultados = {}
+    for n in tamanos:
+        entradas = generar_entradas(n)
+        clave = f"{n}"
+
+        filtros = {
+            "all": {},
+            "last_session": {"session_filter": "last"},
+            "tags_sites": {"tags": ["puma", "zorro"], "sites": SITIOS[:4]},
+            "combined": {"session_filter": "last", "tags": ["puma"], "cameras": CAMARAS[:10],
+                         "operators": OPERADORES[:2], "behaviors": ["come"]}
+        }
+        for nombre, kwargs in filtros.items():
+            resultados[f"filter_videos[{nombre}]@{clave}"] = medir(
+                lambda: filter_videos(entradas, **kwargs), repeticiones
+            )
+
+        try:
+            from gui_tagger import DynamicTagger
+        except ImportError as e:
+            resultados[f"update_consolidated_metadata@{clave}"] = _omitido("update_consolidated_metadata", e)
+        else:
+            output_root = tempfile.mkdtemp(prefix="out_", dir=carpeta)
+            escribir_consolidado(output_root, entradas)
+            # Solo usa self.output_folder: se llama sin construir la ventana
+            tagger = SimpleNamespace(output_folder=output_root)
+            cambio = dict(entradas[-1], tags=["puma"], notes="benchmark")
+            resultados[f"update_consolidated_metadata@{clave}"] = medir(
+                lambda: DynamicTagger.update_consolidated_metadata(tagger, dict(cambio)), repeticiones
+            )
+            shutil.rmtree(output_root, ignore_errors=True)
+
+        try:
+            from gui_analysis import AnalysisGUI
+        except ImportError as e:
+            resultados[f"build_dataframe@{clave}"] = _omitido("_build_dataframe", e)
+        else:
+            # _build_dataframe no usa self
+            resultados[f"build_dataframe@{clave}"] = medir(
+                lambda: AnalysisGUI._build_dataframe(None, entradas), repeticiones
+            )
+    return resultados
+
+
+# ---------------------------
+# Reporte
+# ---------------------------
+def comparar(actual, previo_path):
+    """Imprime actual/previo (min) por benchmark; < 1 es más rápido."""
+    with open(previo_path, "r", encoding="utf-8") as f:
+        previo = json.load(f)
+    if previo.get("environment", {}).get("processing") != actual["environment"]["processing"]:
+        print("[benchmark] Aviso: los parámetros de Processing difieren del reporte previo")
+    print(f"{'benchmark':<52} {'previo':>10} {'actual':>10} {'ratio':>7}")
+    for nombre, r in actual["results"].items():
+        p = previo.get("results", {}).get(nombre)
+        if not p or "min" not in p or "min" not in r:
+            continue
+        ratio = r["min"] / p["min"] if p["min"] > 0 else float("nan")
+        print(f"{nombre:<52} {p['min']:>10.4f} {r['min']:>10.4f} {ratio:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks sintéticos de procesamiento y metadatos.")
+    parser.add_argument("--dir", help="Carpeta de trabajo (por defecto, una temporal que se borra al final)")
+    parser.add_argument("--videos", type=int, default=4, help="Videos sintéticos (por defecto 4)")
+    parser.add_argument("--segundos", type=int, default=20, help="Duración de cada video (por defecto 20 s)")
+    parser.add_argument("--fotos", type=int, default=30, help="Fotos sintéticas, en ráfagas de 3 (por defecto 30)")
+    parser.add_argument("--entradas", default="10000,50000,200000",
+                        help="Tamaños de consolidado separados por coma (por defecto 10000,50000,200000)")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Corridas por benchmark (se reporta el mínimo)")
+    parser.add_argument("--solo", choices=["videos", "fotos", "metadatos"], action="append",
+                        help="Correr solo estos grupos (repetible)")
+    parser.add_argument("--salida", default="benchmark_report.json", help="Reporte JSON de salida")
+    parser.add_argument("--comparar", help="Reporte previo contra el cual comparar")
+    args = parser.parse_args()
+
+    grupos = args.solo or ["videos", "fotos", "metadatos"]
+    tamanos = [int(x) for x in args.entradas.split(",") if x.strip()]
+    carpeta = args.dir or tempfile.mkdtemp(prefix="benchmark_")
+    input_folder = os.path.join(carpeta, "input")
+
+    t0 = time.time()
+    inicio_fotos = datetime(2024, 3, 1, 6, 0, 0)
+    if "videos" in grupos:
+        generar_videos(input_folder, args.videos, segundos=args.segundos)
+    if "videos" in grupos or "fotos" in grupos:
+        generar_fotos(input_folder, args.fotos, inicio_fotos)
+    print(f"[benchmark] Dataset en {carpeta} ({time.time() - t0:.1f} s)")
+
+    resultados = {}
+    try:
+        if "videos" in grupos:
+            resultados.update(bench_videos(carpeta, args.repeticiones))
+        if "fotos" in grupos:
+            resultados.update(bench_fotos(carpeta, args.repeticiones))
+        if "metadatos" in grupos:
+            resultados.update(bench_metadatos(carpeta, tamanos, args.repeticiones))
+    finally:
+        if not args.dir:
+            shutil.rmtree(carpeta, ignore_errors=True)
+
+    reporte = {
+        "version": BENCHMARK_VERSION,
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "environment": entorno(),
+        "params": {
+            "videos": args.videos, "segundos": args.segundos, "fotos": args.fotos,
+            "entradas": tamanos, "repeticiones": args.repeticiones, "grupos": grupos
+        },
+        "results": resultados
+    }
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(reporte, f, indent=2, ensure_ascii=False)
+    for nombre, r in resultados.items():
+        if "min" in r:
+            print(f"{nombre:<52} {r['min']:>10.4f} s")
+    print(f"[benchmark] Reporte guardado en {args.salida}")
+
+    if args.comparar:
+        comparar(reporte, args.comparar)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+# comparar_motores.py
+"""
+Arnés A/B de motores de puntuación: corre dos implementaciones sobre el mismo set de
+fixtures y verifica que elijan los mismos tops y den un promedio y una máscara casi
+idénticos, junto con el speedup y el pico de memoria de cada una.
+
+Un motor es una función motor(fuente, fondo_fijo) -> (promedio, top_items, mascara):
+- fuente: FrameSource (frames gris uint8); fondo_fijo=True para ráfagas de fotos.
+- promedio: float32 (h, w) a resolución completa.
+- top_items: [(score, indice, gris, ...)] de mayor a menor, como puntuar_fuente.
+- mascara: uint8 (h // 4, w // 4), la que se escribiría como mask.jpg (o None sin tops).
+Motores incluidos: "actual" (puntuar_fuente / puntuar_rafaga y sus máscaras, lo que corre
+procesamiento) y "referencia" (el cálculo original, escrito aparte: videos frame a frame con
+calcular_metrica_mov, ráfagas como procesar_grupo_de_fotos, y la máscara de cada tipo como
+se generaba antes). Cualquier otro se pasa como "modulo:funcion".
+
+Cada fixture se decodifica una sola vez (con la FRAME_BACKEND de config.ini) y ambos
+motores leen los mismos frames desde memoria, así el tiempo medido es solo el del motor.
+A es la referencia y B el candidato: speedup = tiempo_a / tiempo_b, mayor que 1 si B es
+más rápido. Cada motor entrega su propia máscara, así un cambio en la de videos o en la de
+ráfagas aparece como diferencia contra la referencia.
+
+Uso:
+  python comparar_motores.py [--a referencia] [--b actual] [--fixtures CARPETA]
+                             [--repeticiones R] [--salida reporte.json]
+Sin --fixtures se generan videos y ráfagas sintéticas (ver benchmark.py).
+Termina con código 1 si algún fixture no pasa las tolerancias.
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import importlib
+import tracemalloc
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+import cv2
+
+from scan_utils import escanear_carpeta
+from frame_sources import ProxySource, ImageSequenceSource, obtener_dimensiones_video
+from procesamiento import (
+    puntuar_fuente, puntuar_rafaga, calcular_metrica_mov, mascara_de_tops, mascara_rafaga,
+    abrir_fuente_video, obtener_fotos_con_timestamp, agrupar_en_rafagas,
+    BUFFER_N, TOP_K, MASK_OFFSET, MASK_SATURATED
+)
+
+# Tolerancias por defecto: el promedio en niveles de gris (float) y la máscara en
+# fracción de píxeles que difieren en más de MASK_PIXEL_TOL niveles
+PROMEDIO_TOL = 0.5
+MASK_PIXEL_TOL = 8
+MASK_FRAC_TOL = 0.001
+
+
+# ---------------------------
+# Motores
+# ---------------------------
+def motor_actual(fuente, fondo_fijo=False):
+    if fondo_fijo:
+        avg, top_items = puntuar_rafaga(fuente)
+        mascara = mascara_rafaga(top_items[0][2], avg) if top_items else None
+        return avg.astype(np.float32), top_items, mascara
+    fondo, top_items, _ = puntuar_fuente(fuente)
+    promedio = fondo.promedio()
+    mascara = mascara_de_tops([item[2] for item in top_items], promedio) if top_items else None
+    return promedio, top_items, mascara
+
+
+def _mov_local_referencia(frame, avg, grid=(4, 4)):
+    """Máxima media de |frame - avg| por parche de la grilla, parche a parche."""
+    h, w = frame.shape
+    gh, gw = grid
+    mayor = 0
+    for i in range(gh):
+        for j in range(gw):
+            y0, y1 = i * h // gh, (i + 1) * h // gh
+            x0, x1 = j * w // gw, (j + 1) * w // gw
+            parche = np.abs(frame[y0:y1, x0:x1].astype(np.float32) - avg[y0:y1, x0:x1].astype(np.float32)).mean()
+            mayor = max(mayor, parche)
+    return mayor
+
+
+def _mascara_referencia(frame, avg, interpolacion):
+    """|frame - avg| menos MASK_OFFSET, saturado con np.percentile y reducido a 1/4."""
+    diff = np.abs(frame.astype(np.float32) - avg.astype(np.float32))
+    diff = diff - MASK_OFFSET
+    diff[diff < 0] = 0
+    if diff.size > 0:
+        umbral = np.percentile(diff.flatten(), 100 * (1 - MASK_SATURATED))
+        diff = np.clip(diff * 255 / max(umbral, 1), 0, 255)
+    mask = diff.astype(np.uint8)
+    return cv2.resize(mask, (mask.shape[1] // 4, mask.shape[0] // 4), interpolation=interpolacion)
+
+
+def motor_referencia(fuente, fondo_fijo=False):
+    """
+    Cálculo original. Videos: promedio float de la ventana, calcular_metrica_mov por frame y
+    máscara del top con mayor movimiento local. Ráfagas: promedio uint8 de todas las fotos,
+    puntaje a resolución completa, argsort y máscara del mejor top (procesar_grupo_de_fotos).
+    """
+    frames = []
+    buf = np.empty((fuente.height, fuente.width), dtype=np.uint8)
+    if fondo_fijo:
+        while fuente.leer_en(buf):
+            frames.append(buf.copy())
+        if not frames:
+            return None, [], None
+        avg = np.mean(frames, axis=0).astype(np.uint8)
+        scores = [np.abs(f.astype(np.float32) - avg.astype(np.float32)).mean() for f in frames]
+        top_indices = np.argsort(scores)[-TOP_K:][::-1]
+        top_items = [(scores[k], int(k), frames[k]) for k in top_indices]
+        mascara = _mascara_referencia(frames[top_indices[0]], avg, cv2.INTER_LINEAR)
+        return avg.astype(np.float32), top_items, mascara
+
+    ventana = deque(maxlen=BUFFER_N)
+    scores = []
+    idx = 0
+    while fuente.leer_en(buf):
+        frame = buf.copy()
+        ventana.append(frame)
+        avg = np.mean(np.stack(ventana), axis=0, dtype=np.float32)
+        scores.append((calcular_metrica_mov(frame, avg), idx, frame))
+        idx += 1
+    # Mismo desempate que el heap de puntuar_fuente: a igual puntaje gana el índice mayor
+    scores.sort(key=lambda x: (-x[0], -x[1]))
+    if not scores:
+        return None, [], None
+    avg = np.mean(np.stack(ventana), axis=0, dtype=np.float32)
+    top_items = scores[:TOP_K]
+    # El primer top con el mayor movimiento local, como el bucle original
+    mejor = top_items[0][2]
+    mayor = -1
+    for item in top_items:
+        local = _mov_local_referencia(item[2], avg)
+        if local > mayor:
+            mayor, mejor = local, item[2]
+    return avg, top_items, _mascara_referencia(mejor, avg, cv2.INTER_AREA)
+
+
+MOTORES = {"actual": motor_actual, "referencia": motor_referencia}
+
+
+def cargar_motor(spec):
+    """'actual', 'referencia' o 'modulo:funcion'."""
+    if spec in MOTORES:
+        return MOTORES[spec]
+    if ":" not in spec:
+        raise ValueError(f"Motor desconocido: {spec} (use {', '.join(MOTORES)} o modulo:funcion)")
+    modulo, funcion = spec.split(":", 1)
+    return getattr(importlib.import_module(modulo), funcion)
+
+
+# ---------------------------
+# Fixtures
+# ---------------------------
+def _leer_todo(fuente):
+    frames = []
+    buf = np.empty((fuente.height, fuente.width), dtype=np.uint8)
+    while fuente.leer_en(buf):
+        frames.append(buf.copy())
+    return np.stack(frames) if frames else None
+
+
+def cargar_fixtures(carpeta):
+    """
+    Decodifica una vez cada video y cada ráfaga de fotos de `carpeta`.
+    Devuelve [{"nombre", "fondo_fijo", "frames" (N, h, w) uint8}].
+    """
+    videos, _ = escanear_carpeta(carpeta)
+    fixtures = []
+    for archivo in videos:
+        path = archivo.path
+        nombre = os.path.relpath(path, carpeta)
+        try:
+            width, height = obtener_dimensiones_video(path)
+        except Exception as e:
+            print(f"[comparar] {nombre}: sin dimensiones, se omite ({e})")
+            continue
+        fuente = abrir_fuente_video(path, width, height)
+        if fuente is None:
+            continue
+        with fuente:
+            frames = _leer_todo(fuente)
+        if frames is not None:
+            fixtures.append({"nombre": nombre, "fondo_fijo": False, "frames": frames})
+
+    for grupo in agrupar_en_rafagas(obtener_fotos_con_timestamp(carpeta)):
+        with ImageSequenceSource([f["path"] for f in grupo]) as fuente:
+            frames = _leer_todo(fuente)
+        if frames is not None:
+            nombre = os.path.basename(grupo[0]["path"])
+            fixtures.append({"nombre": f"{nombre} (x{len(grupo)})", "fondo_fijo": True, "frames": frames})
+    return fixtures
+
+
+# ---------------------------
+# Comparación
+# ---------------------------
+def correr(motor, fixture, repeticiones):
+    """Devuelve (promedio, top_items, mascara, mejor tiempo en s, pico de memoria en bytes)."""
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        promedio, top_items, mascara = motor(ProxySource(fixture["frames"]), fixture["fondo_fijo"])
+        tiempos.append(time.perf_counter() - t0)
+    # El pico se mide en una corrida aparte: tracemalloc ralentiza el código Python
+    tracemalloc.start()
+    try:
+        motor(ProxySource(fixture["frames"]), fixture["fondo_fijo"])
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return promedio, top_items, mascara, min(tiempos), pico
+
+
+def comparar_fixture(motor_a, motor_b, fixture, repeticiones=3, promedio_tol=PROMEDIO_TOL,
+                     mask_pixel_tol=MASK_PIXEL_TOL, mask_frac_tol=MASK_FRAC_TOL):
+    prom_a, tops_a, mask_a, t_a, pico_a = correr(motor_a, fixture, repeticiones)
+    prom_b, tops_b, mask_b, t_b, pico_b = correr(motor_b, fixture, repeticiones)
+
+    idx_a = [int(item[1]) for item in tops_a]
+    idx_b = [int(item[1]) for item in tops_b]
+    diff_prom = float(np.abs(prom_a.astype(np.float32) - prom_b.astype(np.float32)).max())
+    if mask_a is None and mask_b is None:
+        frac_mask = 0.0
+    elif mask_a is None or mask_b is None or mask_a.shape != mask_b.shape:
+        frac_mask = 1.0
+    else:
+        frac_mask = float((cv2.absdiff(mask_a, mask_b) > mask_pixel_tol).mean())
+
+    ok = idx_a == idx_b and diff_prom <= promedio_tol and frac_mask <= mask_frac_tol
+    return {
+        "fixture": fixture["nombre"],
+        "frames": int(len(fixture["frames"])),
+        "fondo_fijo": fixture["fondo_fijo"],
+        "tops_a": idx_a,
+        "tops_b": idx_b,
+        "tops_iguales": idx_a == idx_b,
+        "promedio_max_diff": round(diff_prom, 4),
+        "mask_frac_diff": round(frac_mask, 6),
+        "tiempo_a": round(t_a, 6),
+        "tiempo_b": round(t_b, 6),
+        "speedup": round(t_a / t_b, 3) if t_b > 0 else None,
+        "pico_mb_a": round(pico_a / 1e6, 2),
+        "pico_mb_b": round(pico_b / 1e6, 2),
+        "ok": ok
+    }
+
+
+def imprimir(resultados, a, b):
+    print(f"{'fixture':<28} {'frames':>6} {'tops':>5} {'prom':>7} {'mask':>8} "
+          f"{a[:9]:>9} {b[:9]:>9} {'speedup':>7} {'MB a':>7} {'MB b':>7}")
+    for r in resultados:
+        print(f"{r['fixture'][:28]:<28} {r['frames']:>6} {'=' if r['tops_iguales'] else 'DIF':>5} "
+              f"{r['promedio_max_diff']:>7.3f} {r['mask_frac_diff']:>8.5f} "
+              f"{r['tiempo_a']:>9.4f} {r['tiempo_b']:>9.4f} {r['speedup'] or 0:>7.2f} "
+              f"{r['pico_mb_a']:>7.1f} {r['pico_mb_b']:>7.1f}{'' if r['ok'] else '  FALLA'}")
+        if not r["tops_iguales"]:
+            print(f"    tops a: {r['tops_a']}\n    tops b: {r['tops_b']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara dos motores de puntuación (tops, promedio, máscara, tiempo, memoria).")
+    parser.add_argument("--a", default="referencia", help="Motor A, la referencia (por defecto: referencia)")
+    parser.add_argument("--b", default="actual", help="Motor B, el candidato (por defecto: actual)")
+    parser.add_argument("--fixtures", help="Carpeta con videos y fotos (por defecto: set sintético)")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Corridas por motor (se usa el mínimo)")
+    parser.add_argument("--promedio-tol", type=float, default=PROMEDIO_TOL)
+    parser.add_argument("--mask-tol", type=float, default=MASK_FRAC_TOL,
+                        help=f"Fracción máxima de píxeles de la máscara que difieren en más de {MASK_PIXEL_TOL}")
+    parser.add_argument("--salida", help="Guardar los resultados en este JSON")
+    args = parser.parse_args()
+
+    motor_a, motor_b = cargar_motor(args.a), cargar_motor(args.b)
+    carpeta = args.fixtures
+    temporal = None
+    if not carpeta:
+        from benchmark import generar_videos, generar_fotos
+        temporal = carpeta = tempfile.mkdtemp(prefix="fixtures_")
+        generar_videos(carpeta, 3, segundos=30)
+        generar_fotos(carpeta, 12, datetime(2024, 3, 1, 6, 0, 0))
+    try:
+        fixtures = cargar_fixtures(carpeta)
+    finally:
+        if temporal:
+            shutil.rmtree(temporal, ignore_errors=True)
+    if not fixtures:
+        print(f"[comparar] No hay fixtures en {carpeta}")
+        return 1
+
+    resultados = [
+        comparar_fixture(motor_a, motor_b, f, args.repeticiones, args.promedio_tol, mask_frac_tol=args.mask_tol)
+        for f in fixtures
+    ]
+    imprimir(resultados, args.a, args.b)
+    total_a = sum(r["tiempo_a"] for r in resultados)
+    total_b = sum(r["tiempo_b"] for r in resultados)
+    fallas = sum(not r["ok"] for r in resultados)
+    print(f"[comparar] {len(resultados) - fallas}/{len(resultados)} fixtures equivalentes; "
+          f"total {args.a} {total_a:.3f} s, {args.b} {total_b:.3f} s "
+          f"(speedup {total_a / total_b if total_b else 0:.2f})")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"a": args.a, "b": args.b, "resultados": resultados}, f, indent=2, ensure_ascii=False)
+    return 1 if fallas else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -154,7 +154,23 @@ def get_default_config():
             "TOP_K": 6,
             "DOWNSAMPLE_MAX": 320,
             "JPEG_QUALITY": 85,
-            "MASK_QUALITY": 70
+            "MASK_QUALITY": 70,
+            "DECODE_MODE": "full",
+            "COLOR_TOPS": True,
+            "SCAN_MODE": "full",
+            "ADAPTIVE_FPS_COARSE": 0.25,
+            "ADAPTIVE_FPS_FINE": 4,
+            "ADAPTIVE_MAX_FRACTION": 0.5,
+            "ADAPTIVE_REFINE_MAX": 96,
+            "FRAME_BACKEND": "ffmpeg",
+            "PIPELINE_QUEUE": 0,
+            "JPEG_THREADS": 2,
+            "MOV_LOCAL_GRID": 4,
+            "MOTION_THRESHOLD": 2.0,
+            "PROXY_CACHE": False,
+            "PROXY_MAX": 320,
+            "SCAN_THREADS": 8,
+            "STAGING_FOLDER": ""
         },
         "SummaryGlobal": {
             "total_sessions": 0,
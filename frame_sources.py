@@ -0,0 +1,431 @@
+# frame_sources.py
+"""
+Fuentes de frames intercambiables para el motor de puntuación de procesamiento.py.
+Todas entregan frames en gris uint8 escritos directamente en un buffer del llamador:
+- FFmpegPipeSource: ffmpeg en subproceso, frames por pipe (readinto).
+- CV2VideoSource: cv2.VideoCapture en proceso (sin subproceso ni copia por pipe).
+- ImageSequenceSource: ráfaga de fotos (cv2.imread).
+- ProxySource: frames ya reducidos de la caché de proxies (array memory-mapped).
+- SeekSource: muestras sueltas de un video, una búsqueda (-ss) por muestra.
+- PrefetchSource: envuelve otra fuente y la lee en un hilo aparte con una cola acotada.
+"""
+import os
+import time
+import queue
+import threading
+import subprocess
+import numpy as np
+import cv2
+from probe_utils import probe_video
+
+
+# ---------------------------
+# Utilidades ffmpeg
+# ---------------------------
+def obtener_dimensiones_video(video_path):
+    """(width, height) desde la cabecera del contenedor, o con ffprobe si no se reconoce."""
+    info = probe_video(video_path)
+    if not (info.get("width") and info.get("height")):
+        raise ValueError("no se pudieron leer las dimensiones del video")
+    return int(info["width"]), int(info["height"])
+
+
+def leer_completo(stream, buf):
+    """readinto hasta llenar `buf` (ndarray contiguo). Devuelve False si el pipe terminó antes."""
+    view = memoryview(buf).cast("B")
+    total = 0
+    while total < len(view):
+        n = stream.readinto(view[total:])
+        if not n:
+            return False
+        total += n
+    return True
+
+
+# Cuánto antes del instante pedido empieza una búsqueda (-ss): el frame muestreado en t es
+# el último con pts <= t, que puede estar hasta un intervalo nativo antes de t
+MARGEN_BUSQUEDA = 0.25
+
+
+def filtro_fps(fps, desfase=0.0):
+    """
+    Muestreo común a todas las lecturas con ffmpeg: la muestra j es el último frame con
+    pts <= j / fps (round=up; el redondeo por defecto toma el frame más cercano a j / fps,
+    que puede ser posterior). Una lectura que empieza con -ss `desfase` segundos antes del
+    instante buscado corre sus tiempos para que la muestra 0 caiga en ese instante.
+    """
+    filtro = f"fps={fps}:round=up:start_time=0"
+    if desfase > 0:
+        # En AVTB (µs) para que el corrimiento no se redondee a la base de tiempo del archivo
+        filtro = f"settb=AVTB,setpts=PTS-{desfase:.6f}/TB," + filtro
+    return filtro
+
+
+def busqueda(t, margen=MARGEN_BUSQUEDA):
+    """(inicio para -ss, desfase para filtro_fps) de una lectura cuya muestra 0 es la del segundo t."""
+    inicio = max(0.0, t - margen)
+    return inicio, max(0.0, t) - inicio
+
+
+def leer_frames_ffmpeg(video_path, fps=1, escala=None, dims=None):
+    """
+    Lanza ffmpeg y devuelve (proc, frame_size, width, height) de los frames en el pipe.
+    Si se pasa escala=(w, h), ffmpeg reduce los frames dentro del filtro.
+    `dims=(w, h)` evita volver a sondear el video cuando ya se conocen sus dimensiones.
+    """
+    try:
+        if escala is None:
+            width, height = dims if dims else obtener_dimensiones_video(video_path)
+            vf = f"{filtro_fps(fps)},format=gray"
+        else:
+            width, height = escala
+            vf = f"{filtro_fps(fps)},scale={width}:{height}:flags=area,format=gray"
+        frame_size = width * height
+
+        cmd = [
+            "ffmpeg", "-i", video_path,
+            "-vf", vf,
+            "-f", "image2pipe", "-vcodec", "rawvideo", "-"
+        ]
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        return proc, frame_size, width, height
+    except Exception as e:
+        print(f"Error inicializando FFmpeg para {os.path.basename(video_path)}: {e}")
+        return None, 0, 0, 0
+
+
+def extraer_frame_en(video_path, t, width, height, color=True, margen=MARGEN_BUSQUEDA):
+    """
+    Un frame a resolución completa en el segundo `t`, o None: el mismo que la muestra de
+    ese segundo en leer_frames_ffmpeg (filtro_fps). La búsqueda va antes de -i: ffmpeg salta
+    al keyframe previo y decodifica solo desde ahí hasta `t`, no el clip entero.
+    Con margen=0 devuelve el primer frame en o después de `t` (sin decodificar el GOP
+    anterior cuando `t` cae en un keyframe), para muestras que no deben coincidir con otras.
+    """
+    shape = (height, width, 3) if color else (height, width)
+    inicio, desfase = busqueda(t, margen)
+    cmd = [
+        "ffmpeg", "-ss", f"{inicio:.6f}", "-i", video_path,
+        "-frames:v", "1",
+        "-vf", f"{filtro_fps(1, desfase)},format={'bgr24' if color else 'gray'}",
+        "-f", "image2pipe", "-vcodec", "rawvideo", "-"
+    ]
+    res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    frame_size = int(np.prod(shape))
+    if len(res.stdout) < frame_size:
+        return None
+    return np.frombuffer(res.stdout[:frame_size], dtype=np.uint8).reshape(shape)
+
+
+def extraer_frames_por_tiempo(video_path, tiempos, width, height, color=True):
+    """
+    Frames a resolución completa en los segundos `tiempos`, con una búsqueda (-ss) por
+    tiempo en lugar de decodificar todo el video. Devuelve {t: frame} (BGR o gris).
+    """
+    frames = {}
+    for t in tiempos:
+        frame = extraer_frame_en(video_path, t, width, height, color)
+        if frame is not None:
+            frames[t] = frame
+    return frames
+
+
+# ---------------------------
+# Interfaz común
+# ---------------------------
+class FrameSource:
+    """
+    Interfaz de una fuente de frames.
+    - width / height: tamaño de los frames en gris que entrega leer_en.
+    - num_frames: cantidad conocida de frames, o None si no se sabe de antemano.
+    - leer_en(buf): escribe el siguiente frame gris en `buf` (height, width); False al terminar.
+    - color_actual(): BGR del último frame leído (válido hasta la próxima lectura) o None.
+    - usar_buffer_color(buf): el BGR del próximo frame se decodifica directamente en `buf`
+      (height, width, 3); False si la fuente no entrega color así.
+    - colores(indices): {indice: BGR} re-extraídos después, para fuentes sin color_actual.
+    """
+    width = 0
+    height = 0
+    num_frames = None
+
+    def leer_en(self, buf):
+        raise NotImplementedError
+
+    def color_actual(self):
+        return None
+
+    def usar_buffer_color(self, buf):
+        return False
+
+    def colores(self, indices):
+        return {}
+
+    def cerrar(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cerrar()
+        return False
+
+
+class FFmpegPipeSource(FrameSource):
+    """
+    Frames gris desde un proceso ffmpeg ya lanzado (leer_frames_ffmpeg u otro).
+    Con `max_frames` la lectura se corta al llegar a esa cantidad (`recortada` queda True).
+    """
+
+    def __init__(self, proc, width, height, video_path=None, fps=1, color_dims=None, max_frames=None):
+        self.proc = proc
+        self.width = width
+        self.height = height
+        self.video_path = video_path
+        self.fps = fps
+        # Tamaño original para re-extraer tops a color (en modo proxy difiere de width/height)
+        self.color_dims = color_dims or (width, height)
+        self.max_frames = max_frames
+        self.leidos = 0
+        self.recortada = False
+
+    @classmethod
+    def abrir(cls, video_path, fps=1, escala=None, dims=None):
+        proc, frame_size, width, height = leer_frames_ffmpeg(video_path, fps, escala=escala, dims=dims)
+        if proc is None or frame_size == 0:
+            return None
+        return cls(proc, width, height, video_path, fps, color_dims=dims)
+
+    def leer_en(self, buf):
+        if self.max_frames is not None and self.leidos >= self.max_frames:
+            self.recortada = True
+            return False
+        if not leer_completo(self.proc.stdout, buf):
+            return False
+        self.leidos += 1
+        return True
+
+    def colores(self, indices):
+        """Tops a color con una búsqueda por top (el frame i está en el segundo i / fps)."""
+        if not self.video_path:
+            return {}
+        w, h = self.color_dims
+        por_tiempo = {i: i / self.fps for i in indices}
+        frames = extraer_frames_por_tiempo(self.video_path, por_tiempo.values(), w, h)
+        return {i: frames[t] for i, t in por_tiempo.items() if t in frames}
+
+    def cerrar(self):
+        if self.proc is None:
+            return
+        self.proc.stdout.close()
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        self.proc = None
+
+
+class CV2VideoSource(FrameSource):
+    """
+    Decodificación en proceso con cv2.VideoCapture, muestreando a `fps` como filtro_fps
+    (el último frame en o antes de cada múltiplo de 1/fps segundos). Los frames
+    intermedios solo se avanzan con grab(), sin convertirlos.
+    """
+
+    def __init__(self, video_path, fps=1):
+        self.cap = cv2.VideoCapture(video_path)
+        if not self.cap.isOpened():
+            raise IOError(f"cv2 no pudo abrir {os.path.basename(video_path)}")
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        native_fps = self.cap.get(cv2.CAP_PROP_FPS) or fps
+        self.paso = max(1.0, native_fps / fps)
+        self.siguiente = 0.0
+        self.pos = 0
+        self._color = np.empty((self.height, self.width, 3), dtype=np.uint8)
+
+    def leer_en(self, buf):
+        objetivo = int(self.siguiente + 1e-6)
+        while self.pos < objetivo:
+            if not self.cap.grab():
+                return False
+            self.pos += 1
+        ok, frame = self.cap.read(self._color)
+        if not ok or frame is None:
+            return False
+        self._color = frame
+        self.pos += 1
+        self.siguiente += self.paso
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=buf)
+        return True
+
+    def color_actual(self):
+        return self._color
+
+    def usar_buffer_color(self, buf):
+        # cap.read(buf) decodifica en `buf` si coincide en tamaño y tipo
+        self._color = buf
+        return True
+
+    def cerrar(self):
+        self.cap.release()
+
+
+class ImageSequenceSource(FrameSource):
+    """Ráfaga de fotos. Las que no se puedan leer se reemplazan por negro (como antes)."""
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self.num_frames = len(self.paths)
+        self.i = 0
+        self._color = None
+        self._primera = cv2.imread(self.paths[0]) if self.paths else None
+        if self._primera is not None:
+            self.height, self.width = self._primera.shape[:2]
+        else:
+            self.height, self.width = 480, 640
+
+    def leer_en(self, buf):
+        if self.i >= self.num_frames:
+            return False
+        if self.i == 0 and self._primera is not None:
+            img = self._primera
+            self._primera = None
+        else:
+            img = cv2.imread(self.paths[self.i])
+        if img is None:
+            img = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        elif img.shape[:2] != (self.height, self.width):
+            img = cv2.resize(img, (self.width, self.height), interpolation=cv2.INTER_AREA)
+        self._color = img
+        cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=buf)
+        self.i += 1
+        return True
+
+    def color_actual(self):
+        return self._color
+
+
+class ProxySource(FrameSource):
+    """Frames gris ya decodificados en un array (N, h, w), p. ej. un proxy memory-mapped."""
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.num_frames = len(frames)
+        self.height, self.width = frames.shape[1:]
+        self.i = 0
+
+    def leer_en(self, buf):
+        if self.i >= self.num_frames:
+            return False
+        np.copyto(buf, self.frames[self.i])
+        self.i += 1
+        return True
+
+
+class SeekSource(FrameSource):
+    """
+    Muestras gris en los segundos `tiempos`, una búsqueda (extraer_frame_en, sin margen:
+    el primer frame en o después de cada segundo) por muestra: ffmpeg decodifica solo
+    desde el keyframe previo a cada una, no el clip entero.
+    Una muestra que no se pueda leer se salta; `leidos` son los segundos entregados.
+    """
+
+    def __init__(self, video_path, tiempos, width, height):
+        self.video_path = video_path
+        self.tiempos = list(tiempos)
+        self.width = width
+        self.height = height
+        self.leidos = []
+        self.i = 0
+
+    def leer_en(self, buf):
+        while self.i < len(self.tiempos):
+            t = self.tiempos[self.i]
+            self.i += 1
+            frame = extraer_frame_en(self.video_path, t, self.width, self.height, color=False, margen=0)
+            if frame is not None:
+                np.copyto(buf, frame)
+                self.leidos.append(t)
+                return True
+        return False
+
+
+class PrefetchSource(FrameSource):
+    """
+    Lee la fuente envuelta en un hilo propio sobre `profundidad` buffers preasignados
+    (cola acotada), para que la decodificación y la lectura del pipe se solapen con la
+    puntuación (numpy y cv2 liberan el GIL). Cuesta una copia en gris por frame; el color
+    (si la fuente lo entrega) se decodifica directamente en el buffer de cada slot, sin copia.
+    Solo conviene con núcleos libres: no dentro de los procesos del Pool.
+    Mide cuánto esperó cada lado: espera_lectura (el consumidor, sin frames listos) y
+    espera_puntuacion (el lector, con la cola llena).
+    """
+
+    def __init__(self, fuente, profundidad=4):
+        self.fuente = fuente
+        self.width = fuente.width
+        self.height = fuente.height
+        self.num_frames = fuente.num_frames
+        # Un buffer extra: el último entregado sigue en uso (color_actual) hasta la próxima lectura
+        self._bufs = np.empty((profundidad + 1, self.height, self.width), dtype=np.uint8)
+        self._colores = np.empty((profundidad + 1, self.height, self.width, 3), dtype=np.uint8)
+        if not fuente.usar_buffer_color(self._colores[0]):
+            self._colores = None
+        self._libres = queue.Queue()
+        for i in range(1, profundidad + 1):
+            self._libres.put(i)
+        self._en_uso = 0
+        self._llenos = queue.Queue()
+        self._parar = False
+        self._fin = False
+        self._error = None
+        self.espera_lectura = 0.0
+        self.espera_puntuacion = 0.0
+        self._hilo = threading.Thread(target=self._leer, daemon=True)
+        self._hilo.start()
+
+    def _leer(self):
+        try:
+            while not self._parar:
+                t = time.perf_counter()
+                i = self._libres.get()
+                self.espera_puntuacion += time.perf_counter() - t
+                if i is None:
+                    break
+                if self._colores is not None:
+                    self.fuente.usar_buffer_color(self._colores[i])
+                if not self.fuente.leer_en(self._bufs[i]):
+                    break
+                self._llenos.put(i)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._llenos.put(None)
+
+    def leer_en(self, buf):
+        if self._fin:
+            return False
+        t = time.perf_counter()
+        i = self._llenos.get()
+        self.espera_lectura += time.perf_counter() - t
+        if i is None:
+            self._fin = True
+            if self._error is not None:
+                raise self._error
+            return False
+        np.copyto(buf, self._bufs[i])
+        self._libres.put(self._en_uso)
+        self._en_uso = i
+        return True
+
+    def color_actual(self):
+        return self._colores[self._en_uso] if self._colores is not None else None
+
+    def colores(self, indices):
+        return self.fuente.colores(indices)
+
+    def cerrar(self):
+        self._parar = True
+        self._libres.put(None)
+        self._hilo.join()
+        self.fuente.cerrar()
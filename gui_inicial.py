@@ -1,20 +1,26 @@
 import os
+import json
+import queue
+import argparse
 import threading
 import time
 import tkinter as tk
 from tkinter import filedialog, messagebox
 
 from procesamiento import (
-    escanear_videos, wrapper, metadata_lock,
-    obtener_fotos_con_timestamp, agrupar_en_rafagas, procesar_todas_las_rafagas
+    escanear_videos, cargar_caches_escaneo, guardar_caches_escaneo, wrapper, metadata_lock,
+    obtener_fotos_con_timestamp, agrupar_en_rafagas, procesar_todas_las_rafagas,
+    guardar_reporte_etapas, STAGING_FOLDER
 )
 from gui_tagger import DynamicTagger
 from config_utils import generate_session_id, load_config
+from scan_utils import escanear_carpeta, ArchivoEscaneado
+from staging import CopiaTarjeta
 
 
 
 class GUIInicial(tk.Tk):
-    def __init__(self):
+    def __init__(self, session_id=None):
         super().__init__()
 
         # --- Cargar configuración ---
@@ -79,11 +85,52 @@ class GUIInicial(tk.Tk):
             fg=colors.get("button_fg", "white")
         ).pack(pady=10)
 
+        # Progreso del escaneo de la carpeta
+        self.status_var = tk.StringVar(value="")
+        tk.Label(self, textvariable=self.status_var, bg=colors.get("bg", "#f0f0f0"),
+                 font=tuple(fonts.get("default", ("Arial", 10)))).pack(pady=2)
+
         # --- Variables internas ---
         self.session_id = generate_session_id(self.config_data)
         self.input_folder = ""
         self.metadata_path = ""  # ←←← ahora será dentro de sessions/{session_id}/
         self.metadata_list = []
+        # Ingesta incremental ("agregar más videos" desde el tagger): entradas que la
+        # sesión ya tiene; metadata_list guarda solo lo nuevo
+        self.existentes = []
+        # Datos de despliegue fijados en start(); con staging llegan entradas después
+        self.despliegue = None
+        if session_id:
+            self._cargar_sesion_existente(session_id)
+
+    def _cargar_sesion_existente(self, session_id):
+        """Retoma una sesión: mismos ID y datos de despliegue, y solo se agregan archivos nuevos."""
+        output_folder = self.config_data["General"]["output_folder"]
+        path = os.path.join(output_folder, "sessions", session_id, "metadata.json")
+        if not os.path.exists(path):
+            print(f"Advertencia: no existe la sesión {session_id}, se crea una nueva")
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.existentes = json.load(f)
+        except Exception as e:
+            print(f"Advertencia: no se pudo leer la sesión {session_id}, se crea una nueva: {e}")
+            return
+        self.session_id = session_id
+        if self.existentes:
+            previa = self.existentes[0]
+            for entry, key in [(self.entry_site, "site"), (self.entry_subsite, "subsite"),
+                               (self.entry_camera, "camera"), (self.entry_operator, "operator")]:
+                entry.insert(0, previa.get(key, ""))
+        self.status_var.set(f"Sesión {session_id}: {len(self.existentes)} entradas; se agregan solo archivos nuevos")
+
+    def _fotos_de_sesion(self):
+        """Rutas de fotos que la sesión ya usa (asociadas a videos o procesadas como ráfagas)."""
+        rutas = set()
+        for e in self.existentes:
+            rutas.update(e.get("associated_photos") or [])
+            rutas.update(e.get("original_photos") or [])
+        return rutas
 
     # -------------------------------
     # Crear etiqueta y campo de texto
@@ -117,30 +164,30 @@ class GUIInicial(tk.Tk):
         os.makedirs(session_folder, exist_ok=True)
         self.metadata_path = os.path.join(session_folder, "metadata.json")
 
+        # Staging opcional: copiar la tarjeta a disco local y procesar cada video al copiarse
+        if STAGING_FOLDER:
+            self._procesar_con_staging(output_folder)
+            return
+
         # Escanear como videos (incluye modo híbrido)
-        self.metadata_list = escanear_videos(self.input_folder, output_folder)
+        self._set_status("Escaneando carpeta...")
+        self.metadata_list = escanear_videos(
+            self.input_folder, output_folder,
+            progreso=lambda hechos, total: self._set_status(f"Escaneando videos: {hechos}/{total}"),
+            existentes=self.existentes
+        )
+        if self.existentes:
+            # Un archivo modificado reemplaza a su entrada anterior (mismo video_path)
+            rutas_nuevas = {m["video_path"] for m in self.metadata_list}
+            self.existentes = [e for e in self.existentes if e.get("video_path") not in rutas_nuevas]
+            self._set_status(f"Videos nuevos: {len(self.metadata_list)}")
+        else:
+            self._set_status(f"Videos encontrados: {len(self.metadata_list)}")
         self._save_metadata_temporal()
 
         # ←←← NUEVO: detectar si es modo fotos puras →→→
-        if not self.metadata_list:
-            # Verificar si hay fotos
-            img_exts = {'.jpg', '.jpeg', '.png', '.JPG', '.JPEG', '.PNG'}
-            has_photos = any(
-                os.path.isfile(os.path.join(self.input_folder, f)) and
-                os.path.splitext(f)[1] in img_exts
-                for f in os.listdir(self.input_folder)
-            )
-            if has_photos:
-                # Guardar metadatos vacíos temporalmente
-                self.metadata_list = []
-                self._save_metadata_temporal()
-                # Lanzar detección en segundo plano
-                threading.Thread(
-                    target=self._detectar_fotos_puras_bg,
-                    args=(output_folder,),
-                    daemon=True
-                ).start()
-                return
+        if not self.metadata_list and self._iniciar_fotos_puras(output_folder):
+            return
         # →→→ FIN NUEVO
 
         # Procesar videos (igual que antes)
@@ -154,11 +201,9 @@ class GUIInicial(tk.Tk):
             def process_rest():
                 from multiprocessing import Pool, cpu_count
                 rest = self.metadata_list[first_n:]
-                if not rest:
-                    return
                 args_list = [(m, output_folder) for m in rest]
                 num_proc = max(1, cpu_count() - 1)
-                if num_proc > 1:
+                if num_proc > 1 and args_list:
                     with Pool(num_proc) as pool:
                         for res in pool.imap_unordered(wrapper, args_list):
                             for idx, v in enumerate(self.metadata_list):
@@ -172,15 +217,141 @@ class GUIInicial(tk.Tk):
                             if v["video_path"] == res["video_path"]:
                                 self.metadata_list[idx] = res
                         self._save_metadata_temporal()
+                self._save_timing_report()
 
             threading.Thread(target=process_rest, daemon=True).start()
 
         threading.Thread(target=process_first_videos, daemon=True).start()
 
+    def _iniciar_fotos_puras(self, output_folder):
+        """Sin videos: si hay fotos nuevas, lanza la detección de ráfagas. Devuelve True si la lanzó."""
+        # Verificar si hay fotos (también en subcarpetas, como escanear_videos)
+        _, imagenes = escanear_carpeta(self.input_folder, excluir=(output_folder,))
+        ya_usadas = self._fotos_de_sesion()
+        has_photos = any(a.path not in ya_usadas for a in imagenes)
+        if not has_photos:
+            return False
+        # Guardar metadatos vacíos temporalmente
+        self.metadata_list = []
+        self._save_metadata_temporal()
+        # Lanzar detección en segundo plano
+        threading.Thread(
+            target=self._detectar_fotos_puras_bg,
+            args=(output_folder,),
+            daemon=True
+        ).start()
+        return True
+
+    def _procesar_con_staging(self, output_folder):
+        """
+        Copia la tarjeta a STAGING_FOLDER/<session_id> (staging.py) y procesa cada video apenas
+        termina su copia: un hilo escanea solo los videos recién copiados (escanear_videos con
+        archivos=...) y los pone en una cola que alimenta el Pool, mientras la copia sigue.
+        """
+        from multiprocessing import Pool, cpu_count
+        destino = os.path.join(STAGING_FOLDER, self.session_id)
+        copia = CopiaTarjeta(self.input_folder, destino, excluir=(output_folder,))
+        copiados = queue.Queue()
+        pendientes = queue.Queue()
+        errores = []
+        # Caché de sondeo e índice de huellas: se leen una vez y se guardan al final
+        caches = cargar_caches_escaneo(output_folder)
+
+        def copiar():
+            try:
+                copia.copiar(
+                    al_copiar_video=copiados.put,
+                    progreso=lambda hechos, total: self._set_status(f"Copiando tarjeta: {hechos}/{total}")
+                )
+            except Exception as e:
+                errores.append(e)
+            finally:
+                copiados.put(None)
+
+        def escanear():
+            imagenes = None
+            try:
+                fin = False
+                while not fin:
+                    # Todo lo copiado desde la última tanda (al menos un video o el fin de la copia)
+                    lote = [copiados.get()]
+                    while not copiados.empty():
+                        lote.append(copiados.get_nowait())
+                    fin = None in lote
+                    videos = [ArchivoEscaneado(dst, os.stat(dst)) for dst in lote if dst is not None]
+                    if not videos:
+                        continue
+                    if imagenes is None:
+                        # Las fotos se copian antes que cualquier video: basta un recorrido
+                        _, imagenes = escanear_carpeta(destino)
+                    with metadata_lock:
+                        ya_vistas = self.existentes + self.metadata_list
+                    nuevos = escanear_videos(
+                        destino, output_folder,
+                        existentes=ya_vistas,
+                        huellas=dict(copia.huellas),
+                        archivos=(videos, imagenes),
+                        caches=caches
+                    )
+                    # metadata_lock: start() fija el despliegue y los resultados del Pool
+                    # reemplazan entradas desde otro hilo mientras este agrega
+                    with metadata_lock:
+                        for meta in nuevos:
+                            if self.despliegue:
+                                meta.update(self.despliegue)
+                            self.metadata_list.append(meta)
+                    self._save_metadata_temporal()
+                    for meta in nuevos:
+                        pendientes.put(meta)
+            except Exception as e:
+                errores.append(e)
+            finally:
+                pendientes.put(None)
+
+        def trabajos():
+            for meta in iter(pendientes.get, None):
+                yield (meta, output_folder)
+
+        def actualizar(res):
+            with metadata_lock:
+                if self.despliegue:
+                    res.update(self.despliegue)
+                for idx, v in enumerate(self.metadata_list):
+                    if v["video_path"] == res["video_path"]:
+                        self.metadata_list[idx] = res
+                hechos = sum(1 for m in self.metadata_list if m.get("status") == "done")
+                total = len(self.metadata_list)
+            self._save_metadata_temporal()
+            self._set_status(f"Videos procesados: {hechos}/{total}")
+
+        threading.Thread(target=copiar, daemon=True).start()
+        threading.Thread(target=escanear, daemon=True).start()
+        num_proc = max(1, cpu_count() - 1)
+        if num_proc > 1:
+            with Pool(num_proc) as pool:
+                for res in pool.imap_unordered(wrapper, trabajos()):
+                    actualizar(res)
+        else:
+            for args in trabajos():
+                actualizar(wrapper(args))
+        guardar_caches_escaneo(caches, output_folder)
+
+        if errores:
+            self.after(0, lambda: messagebox.showerror("Error", f"Fallo al copiar la tarjeta:\n{errores[0]}"))
+            return
+        # Lo que sigue (fotos puras, tagger) trabaja sobre la copia local
+        self.input_folder = destino
+        self._save_timing_report()
+        if not self.metadata_list:
+            self._iniciar_fotos_puras(output_folder)
+
     def _detectar_fotos_puras_bg(self, output_folder):
         """Detecta ráfagas automáticamente y programa el diálogo en el hilo principal."""
         try:
-            fotos_con_ts = obtener_fotos_con_timestamp(self.input_folder)
+            fotos_con_ts = obtener_fotos_con_timestamp(self.input_folder, excluir=(output_folder,))
+            if self.existentes:
+                ya_usadas = self._fotos_de_sesion()
+                fotos_con_ts = [f for f in fotos_con_ts if f["path"] not in ya_usadas]
             if not fotos_con_ts:
                 return
             
@@ -269,6 +440,7 @@ class GUIInicial(tk.Tk):
         """Actualiza la lista de metadatos con los resultados de fotos."""
         self.metadata_list = metadata_list
         self._save_metadata_temporal() 
+        self._save_timing_report()
 
     # -------------------------------
     # Abrir GUI de tagging
@@ -322,16 +494,20 @@ class GUIInicial(tk.Tk):
         camera = self.entry_camera.get()
         operator = self.entry_operator.get()
 
-        for entry in self.metadata_list:
-            entry["site"] = site
-            entry["subsite"] = subsite
-            entry["camera"] = camera
-            entry["operator"] = operator
-            entry["session_id"] = self.session_id
-            # <-- AÑADIR ESTA LÍNEA -->
+        despliegue = {
+            "site": site,
+            "subsite": subsite,
+            "camera": camera,
+            "operator": operator,
+            "session_id": self.session_id,
             # Registrar si la sesión se inició en modo Camtrap DB
-            entry["camtrap_db_session"] = self.camtrap_mode_var.get()
-            # <-- FIN AÑADIDO -->
+            "camtrap_db_session": self.camtrap_mode_var.get()
+        }
+        # Con staging el hilo de escaneo y el Pool siguen agregando y reemplazando entradas
+        with metadata_lock:
+            self.despliegue = despliegue
+            for entry in self.metadata_list:
+                entry.update(despliegue)
 
         self._save_metadata_temporal()
 
@@ -342,12 +518,31 @@ class GUIInicial(tk.Tk):
         app = DynamicTagger(metadata_path=self.metadata_path, session_id=self.session_id)
         app.mainloop()
 
+    def _set_status(self, texto):
+        """Actualiza la línea de estado desde cualquier hilo (sin efecto si la ventana ya se cerró)."""
+        try:
+            self.after(0, lambda: self.status_var.set(texto))
+        except (tk.TclError, RuntimeError):
+            pass
+
+    def _save_timing_report(self):
+        """Reporte de tiempos por etapa de la sesión (sessions/{session_id}/timing_report.json)."""
+        try:
+            path = os.path.join(os.path.dirname(self.metadata_path), "timing_report.json")
+            with metadata_lock:
+                entradas = self.existentes + self.metadata_list
+            guardar_reporte_etapas(entradas, path)
+        except Exception as e:
+            print(f"Advertencia: no se pudo guardar el reporte de tiempos: {e}")
+
     def _save_metadata_temporal(self):
-        """Guarda self.metadata_list en self.metadata_path de forma segura."""
+        """
+        Guarda las entradas previas de la sesión más self.metadata_list en self.metadata_path de
+        forma segura. Toma metadata_lock (no reentrante): no llamar con el lock tomado.
+        """
         with metadata_lock:
-            import json
             with open(self.metadata_path, "w") as f:
-                json.dump(self.metadata_list, f, indent=4)
+                json.dump(self.existentes + self.metadata_list, f, indent=4)
 
     def _toggle_camtrap_mode(self):
         """Cambia el estado del toggle y actualiza la interfaz."""
@@ -365,5 +560,8 @@ class GUIInicial(tk.Tk):
 
 
 if __name__ == "__main__":
-    gui = GUIInicial()
+    parser = argparse.ArgumentParser(description="Configuración inicial de una sesión.")
+    parser.add_argument("--session_id", help="Agregar archivos nuevos a esta sesión existente")
+    args = parser.parse_args()
+    gui = GUIInicial(session_id=args.session_id)
     gui.mainloop()
\ No newline at end of file
@@ -0,0 +1,357 @@
+# probe_utils.py
+"""
+Sondeo de videos: lector nativo de cabeceras MP4/MOV/AVI, una sola llamada a
+ffprobe por archivo cuando el contenedor no se reconoce, y caché persistente en disco.
+Usado por: procesamiento.py (escanear_videos, obtener_fecha_video, procesar_video).
+"""
+import os
+import json
+import struct
+import subprocess
+import threading
+from datetime import datetime, timezone
+
+PROBE_CACHE_VERSION = 1
+_cache_lock = threading.Lock()
+
+
+def _parse_fps(rate):
+    """Convierte '30000/1001' (o '25') a float; 0.0 si no se puede."""
+    try:
+        if "/" in rate:
+            num, den = rate.split("/", 1)
+            return float(num) / float(den) if float(den) else 0.0
+        return float(rate)
+    except Exception:
+        return 0.0
+
+
+def _empty_info():
+    return {
+        "creation_time": None,
+        "width": None,
+        "height": None,
+        "duration": None,
+        "fps": None,
+        "codec": None
+    }
+
+
+# ---------------------------
+# Lector nativo de cabeceras
+# ---------------------------
+# Segundos entre 1904-01-01 (época MP4) y 1970-01-01
+MP4_EPOCH_OFFSET = 2082844800
+
+# Nombres de códec tal como los reporta ffprobe
+FOURCC_CODECS = {
+    "avc1": "h264", "avc3": "h264", "h264": "h264", "x264": "h264",
+    "hvc1": "hevc", "hev1": "hevc", "hevc": "hevc", "h265": "hevc",
+    "mp4v": "mpeg4", "xvid": "mpeg4", "divx": "mpeg4", "fmp4": "mpeg4", "dx50": "mpeg4",
+    "mjpg": "mjpeg", "mjpa": "mjpeg", "jpeg": "mjpeg", "avdj": "mjpeg",
+}
+
+# Cajas MP4 en las que hay que descender; el resto se salta con seek
+_MP4_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+
+def _codec_name(fourcc):
+    name = fourcc.decode("latin-1").strip("\x00 ").lower()
+    return FOURCC_CODECS.get(name, name or None)
+
+
+def _iter_mp4_boxes(f, end):
+    """Itera (tipo, inicio_payload, fin_box) sin leer el contenido de las cajas."""
+    pos = f.tell()
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        payload = pos + 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            payload = pos + 16
+        elif size == 0:
+            size = end - pos
+        if size < 8:
+            return
+        yield box_type, payload, min(pos + size, end)
+        pos += size
+
+
+def _parse_mp4(f, file_size):
+    info = _empty_info()
+    found_moov = False
+    track = {}
+
+    def walk(end, depth):
+        nonlocal found_moov
+        for box_type, payload, box_end in _iter_mp4_boxes(f, end):
+            f.seek(payload)
+            if box_type == b"moov":
+                found_moov = True
+            if box_type in _MP4_CONTAINERS:
+                if box_type == b"trak":
+                    track.clear()
+                walk(box_end, depth + 1)
+                if box_type == b"trak" and track.get("video") and info["width"] is None:
+                    info["width"] = track.get("width")
+                    info["height"] = track.get("height")
+                    info["codec"] = track.get("codec")
+                    if track.get("timescale") and track.get("delta"):
+                        info["fps"] = track["timescale"] / track["delta"]
+            elif box_type == b"mvhd":
+                version = f.read(1)[0]
+                f.read(3)
+                if version == 1:
+                    creation, _, timescale, duration = struct.unpack(">QQIQ", f.read(28))
+                else:
+                    creation, _, timescale, duration = struct.unpack(">IIII", f.read(16))
+                if creation:
+                    # Igual que ffmpeg: algunos equipos escriben época Unix en vez de 1904
+                    if creation >= MP4_EPOCH_OFFSET:
+                        creation -= MP4_EPOCH_OFFSET
+                    dt = datetime.fromtimestamp(creation, tz=timezone.utc)
+                    info["creation_time"] = dt.strftime("%Y-%m-%dT%H:%M:%S.000000Z")
+                if timescale:
+                    info["duration"] = duration / timescale
+            elif box_type == b"mdhd":
+                version = f.read(1)[0]
+                f.read(3)
+                if version == 1:
+                    _, _, timescale = struct.unpack(">QQI", f.read(20))
+                else:
+                    _, _, timescale = struct.unpack(">III", f.read(12))
+                track["timescale"] = timescale
+            elif box_type == b"hdlr":
+                # En MOV, minf tiene además un hdlr de datos ('alis') que no debe pisar a 'vide'
+                f.read(8)
+                if f.read(4) == b"vide":
+                    track["video"] = True
+            elif box_type == b"stsd":
+                f.read(8)
+                entry = f.read(36)
+                if len(entry) == 36:
+                    track["codec"] = _codec_name(entry[4:8])
+                    track["width"], track["height"] = struct.unpack(">HH", entry[32:36])
+            elif box_type == b"stts":
+                data = f.read(16)
+                if len(data) == 16 and struct.unpack(">I", data[4:8])[0] > 0:
+                    track["delta"] = struct.unpack(">I", data[12:16])[0]
+            if box_type == b"moov" and depth == 0:
+                return
+
+    f.seek(0)
+    walk(file_size, 0)
+    return info if found_moov else None
+
+
+def _avi_creation_time(date):
+    """Como avidec de ffmpeg: 'Mon Sep 26 13:16:16 2023' → '2023-09-26 13:16:16'."""
+    date = date.decode("latin-1", "ignore").strip("\x00\r\n ")
+    months = ["jan", "feb", "mar", "apr", "may", "jun",
+              "jul", "aug", "sep", "oct", "nov", "dec"]
+    parts = date.split()
+    if len(parts) == 5 and parts[1][:3].lower() in months:
+        try:
+            month = months.index(parts[1][:3].lower()) + 1
+            return f"{int(parts[4]):04d}-{month:02d}-{int(parts[2]):02d} {parts[3]}"
+        except ValueError:
+            pass
+    if len(date) >= 19 and date[4] == ":" and date[7] == ":":
+        return date[:4] + "-" + date[5:7] + "-" + date[8:]
+    return date or None
+
+
+def _parse_avi(f, file_size):
+    info = _empty_info()
+    stream_type = None
+
+    def walk(pos, end):
+        nonlocal stream_type
+        while pos + 8 <= end:
+            f.seek(pos)
+            header = f.read(8)
+            if len(header) < 8:
+                return
+            chunk_id, size = struct.unpack("<4sI", header)
+            payload = pos + 8
+            if chunk_id == b"LIST":
+                list_type = f.read(4)
+                if list_type in (b"hdrl", b"strl"):
+                    walk(payload + 4, min(payload + size, end))
+                # 'movi' (los datos) y el resto de listas se saltan
+            elif chunk_id == b"avih":
+                data = f.read(40)
+                if len(data) == 40:
+                    usec, _, _, _, total_frames = struct.unpack("<5I", data[:20])
+                    width, height = struct.unpack("<II", data[32:40])
+                    info["width"], info["height"] = width, height
+                    if usec:
+                        info["fps"] = 1e6 / usec
+                        info["duration"] = total_frames * usec / 1e6
+            elif chunk_id == b"strh":
+                data = f.read(36)
+                if len(data) == 36:
+                    stream_type = data[:4]
+                    if stream_type == b"vids" and info["codec"] is None:
+                        scale, rate = struct.unpack("<II", data[20:28])
+                        if scale and rate:
+                            info["fps"] = rate / scale
+                        info["codec"] = _codec_name(data[4:8])
+            elif chunk_id == b"strf" and stream_type == b"vids":
+                data = f.read(20)
+                if len(data) == 20:
+                    width, height = struct.unpack("<ii", data[4:12])
+                    info["width"], info["height"] = width, abs(height)
+                    compression = _codec_name(data[16:20])
+                    if compression:
+                        info["codec"] = compression
+                stream_type = None
+            elif chunk_id == b"IDIT":
+                info["creation_time"] = _avi_creation_time(f.read(min(size, 64)))
+            pos = payload + size + (size & 1)
+
+    f.seek(12)
+    walk(12, file_size)
+    return info
+
+
+def parse_container_header(video_path):
+    """
+    Lee en proceso la cabecera de MP4/MOV (moov) o AVI (hdrl) y devuelve el mismo dict
+    que probe_video, o None si el contenedor no se reconoce o está incompleto.
+    Solo lee los encabezados de caja necesarios; los datos de muestras se saltan con seek.
+    """
+    try:
+        file_size = os.path.getsize(video_path)
+        with open(video_path, "rb") as f:
+            head = f.read(12)
+            if len(head) < 12:
+                return None
+            if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+                info = _parse_avi(f, file_size)
+            elif head[4:8] in (b"ftyp", b"moov", b"mdat", b"free", b"wide", b"skip"):
+                info = _parse_mp4(f, file_size)
+            else:
+                return None
+    except Exception:
+        return None
+    if not info or not info["width"] or not info["height"]:
+        return None
+    return info
+
+
+def probe_video(video_path):
+    """
+    Devuelve {"creation_time", "width", "height", "duration", "fps", "codec"}.
+    Primero intenta el lector nativo de cabeceras; si el contenedor no se reconoce,
+    lanza ffprobe UNA vez. Los campos que no se puedan leer quedan en None.
+    """
+    info = parse_container_header(video_path)
+    if info is not None:
+        return info
+    return probe_video_ffprobe(video_path)
+
+
+def probe_video_ffprobe(video_path):
+    """Igual que probe_video pero siempre con ffprobe."""
+    info = _empty_info()
+    cmd = [
+        "ffprobe", "-v", "quiet",
+        "-print_format", "json",
+        "-select_streams", "v:0",
+        "-show_entries",
+        "format=duration:format_tags=creation_time:stream=width,height,r_frame_rate,codec_name",
+        video_path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
+        data = json.loads(result.stdout)
+    except Exception:
+        return info
+
+    fmt = data.get("format", {})
+    info["creation_time"] = fmt.get("tags", {}).get("creation_time")
+    try:
+        info["duration"] = float(fmt.get("duration"))
+    except (TypeError, ValueError):
+        pass
+    streams = data.get("streams", [])
+    if streams:
+        stream = streams[0]
+        info["width"] = stream.get("width")
+        info["height"] = stream.get("height")
+        info["codec"] = stream.get("codec_name")
+        info["fps"] = _parse_fps(stream.get("r_frame_rate", "0"))
+    return info
+
+
+# ---------------------------
+# Caché persistente
+# ---------------------------
+def get_probe_cache_path(output_root):
+    return os.path.join(output_root, "cache", "probe_cache.json")
+
+
+def cache_key(path, stat=None):
+    """Clave (path, size, mtime): si el archivo cambia, la entrada deja de coincidir."""
+    if stat is None:
+        stat = os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def load_probe_cache(output_root):
+    path = get_probe_cache_path(output_root)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != PROBE_CACHE_VERSION:
+            return {}
+        return data.get("entries", {})
+    except Exception as e:
+        print(f"Advertencia: caché de sondeo ilegible, se ignora ({path}): {e}")
+        return {}
+
+
+def save_probe_cache(cache, output_root):
+    path = get_probe_cache_path(output_root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with _cache_lock:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": PROBE_CACHE_VERSION, "entries": cache}, f)
+        os.replace(tmp_path, path)
+
+
+def get_video_info(video_path, cache=None, stat=None):
+    """Devuelve la info de probe_video usando la caché si el archivo no cambió."""
+    if cache is None:
+        return probe_video(video_path)
+    try:
+        key = cache_key(video_path, stat)
+    except OSError:
+        return probe_video(video_path)
+    info = cache.get(key)
+    if info is None:
+        info = probe_video(video_path)
+        # Un sondeo fallido (tarjeta ocupada, timeout) no se guarda: se reintenta la próxima vez
+        if (info.get("width") and info.get("height")) or info.get("duration"):
+            with _cache_lock:
+                cache[key] = info
+    return info
+
+
+# ---------------------------
+# Conversión de creation_time
+# ---------------------------
+def creation_time_to_prefix(creation_time):
+    """'2023-09-26T13:16:16Z' → '230926_131616', o None."""
+    if not creation_time:
+        return None
+    fecha = creation_time
+    return fecha[2:4] + fecha[5:7] + fecha[8:10] + "_" + fecha[11:13] + fecha[14:16] + fecha[17:19]
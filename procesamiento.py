@@ -1,6 +1,5 @@
 # procesamiento.py
 import os
-import glob
 import json
 import time
 import subprocess
@@ -11,13 +10,30 @@ import cv2
 from datetime import datetime
 import threading
 import hashlib
-from utils import metadata_lock
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils import metadata_lock, Etapas
 from config_utils import load_config
+from probe_utils import (
+    probe_video, get_video_info, load_probe_cache, save_probe_cache,
+    creation_time_to_prefix
+)
+from frame_sources import (
+    obtener_dimensiones_video, extraer_frames_por_tiempo, filtro_fps, busqueda,
+    FFmpegPipeSource, CV2VideoSource, ImageSequenceSource, ProxySource, PrefetchSource, SeekSource
+)
+from proxy_cache import ProxyWriter, abrir_proxy
+from scan_utils import escanear_carpeta, clave_huella, load_fingerprint_index, save_fingerprint_index
 
-def compute_video_hash(filepath, sample_size=1024*1024, length=16):
-    """Calcula un hash único basado en el contenido del video y lo trunca a 'length' caracteres."""
+def compute_video_hash(filepath, sample_size=1024*1024, length=16, file_size=None):
+    """
+    Calcula un hash único basado en el contenido del video y lo trunca a 'length' caracteres.
+    `file_size` (p. ej. del stat del escaneo) evita volver a consultarlo.
+    """
     try:
-        file_size = os.path.getsize(filepath)
+        if file_size is None:
+            file_size = os.path.getsize(filepath)
         if file_size == 0:
             return "empty_file"
         
@@ -39,62 +55,86 @@ def compute_video_hash(filepath, sample_size=1024*1024, length=16):
         stat = os.stat(filepath)
         fallback = f"fallback_{stat.st_size}_{int(stat.st_mtime)}"
         return fallback[:length] if len(fallback) > length else fallback
+
+
+def bytes_hash_video(filepath, sample_size=1024*1024, file_size=None):
+    """Bytes que lee compute_video_hash: el inicio y, si el archivo es mayor, el final."""
+    if file_size is None:
+        try:
+            file_size = os.path.getsize(filepath)
+        except OSError:
+            return 0
+    return min(file_size, sample_size) + (min(sample_size, file_size) if file_size > sample_size else 0)
+
+
 # --- Configuración ---
 config = load_config()
 PHOTOS_PER_VIDEO = config.get("General", {}).get("photos_per_video", 1)  # por defecto: 1
 
 # --- Parámetros de procesamiento ---
+_processing = config.get("Processing", {})
 FPS_EXTRACT = 1
-BUFFER_N = 15
-TOP_K = 6
-DOWNSAMPLE_MAX = 320
+# Ventana del fondo móvil, tops por video y resolución de puntuación (rescore.py acepta otros valores)
+BUFFER_N = _processing.get("BUFFER_N", 15)
+TOP_K = _processing.get("TOP_K", 6)
+DOWNSAMPLE_MAX = _processing.get("DOWNSAMPLE_MAX", 320)
 JPEG_QUALITY = 85
 MASK_QUALITY = 70
 MASK_OFFSET = 50
 MASK_SATURATED = 0.01
+# "full": ffmpeg entrega frames a resolución original.
+# "proxy": ffmpeg reduce a DOWNSAMPLE_MAX dentro del filtro; la resolución
+# completa se pide solo para los tops (una búsqueda por top) y la ventana final del fondo.
+DECODE_MODE = _processing.get("DECODE_MODE", "full")
+# Tops a color: se re-extraen solo los TOP_K frames elegidos, con una búsqueda (-ss) por top
+COLOR_TOPS = _processing.get("COLOR_TOPS", True)
+# "full": decodifica todo el clip a FPS_EXTRACT.
+# "keyframes": puntúa solo keyframes y decodifica completo alrededor de los picos
+# "adaptive": puntúa a ADAPTIVE_FPS_COARSE (una búsqueda por muestra) y decodifica a
+# ADAPTIVE_FPS_FINE alrededor de los picos
+SCAN_MODE = _processing.get("SCAN_MODE", "full")
+# Códecs sin frames intermedios: "keyframes" no les aplica (se usa "full")
+CODECS_SOLO_INTRA = {"mjpeg", "rawvideo", "prores", "dnxhd", "dvvideo", "ffv1", "huffyuv", "png", "jpeg2000"}
+ADAPTIVE_FPS_COARSE = _processing.get("ADAPTIVE_FPS_COARSE", 0.25)
+ADAPTIVE_FPS_FINE = _processing.get("ADAPTIVE_FPS_FINE", 4)
+# Si las ventanas finas pueden cubrir más de esta fracción del clip, se usa la pasada "full"
+ADAPTIVE_MAX_FRACTION = _processing.get("ADAPTIVE_MAX_FRACTION", 0.5)
+# Máximo de frames finos por video (las ventanas de los picos más altos van primero)
+ADAPTIVE_REFINE_MAX = _processing.get("ADAPTIVE_REFINE_MAX", 96)
+# Fuente de frames de video: "ffmpeg" (subproceso + pipe) o "cv2" (cv2.VideoCapture en proceso)
+FRAME_BACKEND = _processing.get("FRAME_BACKEND", "ffmpeg")
+# Frames decodificados por adelantado en un hilo lector (cola acotada); 0 = todo en un hilo.
+# Apagado por defecto: los procesos del Pool ya ocupan todos los núcleos y no hay con qué solapar
+PIPELINE_QUEUE = _processing.get("PIPELINE_QUEUE", 0)
+# Hilos para codificar los JPEG de salida (compartidos por proceso); 0 = en el hilo actual
+JPEG_THREADS = _processing.get("JPEG_THREADS", 2)
+# Grilla (lado) del puntaje de movimiento local; 16 ayuda con animales pequeños
+MOV_LOCAL_GRID = _processing.get("MOV_LOCAL_GRID", 4)
+# Umbral de la línea de tiempo de movimiento para "segundos con actividad" (motion.npy)
+MOTION_THRESHOLD = _processing.get("MOTION_THRESHOLD", 2.0)
+# Caché de proxies (frames gris reducidos a PROXY_MAX) para re-puntuar sin decodificar (rescore.py)
+PROXY_CACHE = _processing.get("PROXY_CACHE", False)
+PROXY_MAX = _processing.get("PROXY_MAX", 320)
+# Hilos para hash + sondeo durante el escaneo (limitados por la latencia del lector/NAS, no por CPU)
+SCAN_THREADS = _processing.get("SCAN_THREADS", 8)
+# Carpeta local (SSD) donde copiar la tarjeta antes de procesar (staging.py); "" = procesar desde la tarjeta
+STAGING_FOLDER = _processing.get("STAGING_FOLDER", "")
 
 
-def obtener_fecha_video(video_path):
+def obtener_fecha_video(video_path, info=None):
+    """Prefijo YYMMDD_HHMMSS desde creation_time; `info` es el resultado de probe_video si ya se tiene."""
     try:
-        cmd = [
-            "ffprobe", "-v", "quiet",
-            "-print_format", "json",
-            "-show_entries", "format_tags=creation_time",
-            video_path
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-        info = json.loads(result.stdout)
-        fecha = info.get("format", {}).get("tags", {}).get("creation_time", None)
-        if fecha:
-            return fecha[2:4] + fecha[5:7] + fecha[8:10] + "_" + fecha[11:13] + fecha[14:16] + fecha[17:19]
+        if info is None:
+            info = probe_video(video_path)
+        prefix = creation_time_to_prefix(info.get("creation_time"))
+        if prefix:
+            return prefix
     except Exception:
         pass
     ts = os.path.getmtime(video_path)
     return datetime.fromtimestamp(ts).strftime("%y%m%d_%H%M%S")
 
 
-def leer_frames_ffmpeg(video_path, fps=1):
-    try:
-        cmd_dim = [
-            "ffprobe", "-v", "error", "-select_streams", "v:0",
-            "-show_entries", "stream=width,height", "-of", "csv=p=0", video_path
-        ]
-        result = subprocess.run(cmd_dim, capture_output=True, text=True, check=True)
-        width, height = map(int, result.stdout.strip().split(","))
-        frame_size = width * height
-
-        cmd = [
-            "ffmpeg", "-i", video_path,
-            "-vf", f"fps={fps},format=gray",
-            "-f", "image2pipe", "-vcodec", "rawvideo", "-"
-        ]
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-        return proc, frame_size, width, height
-    except Exception as e:
-        print(f"Error inicializando FFmpeg para {os.path.basename(video_path)}: {e}")
-        return None, 0, 0, 0
-
-
 def calcular_metrica_mov(frame, avg, downsample_max=DOWNSAMPLE_MAX):
     if downsample_max is not None:
         h, w = frame.shape
@@ -107,134 +147,1025 @@ def calcular_metrica_mov(frame, avg, downsample_max=DOWNSAMPLE_MAX):
     return diff.mean()
 
 
-def calcular_mov_local(frame, avg, grid=(4, 4)):
-    h, w = frame.shape
-    gh, gw = grid
-    max_local_diff = 0
-    for i in range(gh):
-        for j in range(gw):
-            y0, y1 = i * h // gh, (i + 1) * h // gh
-            x0, x1 = j * w // gw, (j + 1) * w // gw
-            patch_diff = np.abs(
-                frame[y0:y1, x0:x1].astype(np.float32) - avg[y0:y1, x0:x1].astype(np.float32)
-            ).mean()
-            if patch_diff > max_local_diff:
-                max_local_diff = patch_diff
-    return max_local_diff
-
-
-def mapear_mask_gris(diff, offset=MASK_OFFSET, saturado=MASK_SATURATED):
-    diff = np.abs(diff)
-    diff = diff - offset
-    diff[diff < 0] = 0
-    flat = diff.flatten()
-    if len(flat) == 0:
-        return diff.astype(np.uint8)
-    umbral = np.percentile(flat, 100 * (1 - saturado))
-    diff = np.clip(diff * 255 / max(umbral, 1), 0, 255)
-    return diff.astype(np.uint8)
+def tamano_puntuacion(height, width, downsample_max=DOWNSAMPLE_MAX):
+    """Devuelve (w, h) de la resolución de puntuación, o None si no hay que reducir."""
+    if downsample_max is None:
+        return None
+    scale = downsample_max / max(height, width)
+    if scale >= 1.0:
+        return None
+    return (int(width * scale), int(height * scale))
 
 
-def procesar_video(video_meta, output_root):
-    video_path = video_meta["video_path"]
-    v_hash = video_meta["video_hash"]
-    fecha_prefix = video_meta["fecha_prefix"]
+class FondoCircular:
+    """
+    Fondo móvil de los últimos `n` frames sobre un buffer circular preasignado.
+    La suma se mantiene in-place a resolución de puntuación, de modo que por frame
+    solo se escribe el frame en su slot y se reduce una vez; el promedio a resolución
+    completa se calcula una sola vez al final.
 
-    frames_root = os.path.join(output_root, "frames")
-    output_folder = os.path.join(frames_root, v_hash)
-    os.makedirs(output_folder, exist_ok=True)
+    Hay n + 1 slots: el slot libre (`pos`) es el que acaba de salir de la ventana, y en
+    él la fuente escribe el siguiente frame directamente (leer_de), sin asignar
+    memoria nueva por frame.
+    """
 
-    # ←←← REMOVIDO: la copia de fotos ya se hizo en escanear_videos()
-    # Asegurar que el campo original_photos exista (por compatibilidad)
-    if "original_photos" not in video_meta:
-        video_meta["original_photos"] = []
-    # →→→
+    def __init__(self, height, width, n=BUFFER_N, downsample_max=DOWNSAMPLE_MAX):
+        self.n = n
+        self.pos = 0
+        self.count = 0
+        self.ultimo = None
+        self.small_size = tamano_puntuacion(height, width, downsample_max)
+        self.slots = np.empty((n + 1, height, width), dtype=np.uint8)
+        if self.small_size is None:
+            self.small_slots = self.slots
+        else:
+            sw, sh = self.small_size
+            self.small_slots = np.empty((n + 1, sh, sw), dtype=np.uint8)
+        self.suma = np.zeros(self.small_slots.shape[1:], dtype=np.float32)
+        self._avg = np.empty_like(self.suma)
+        self._diff = np.empty_like(self.suma)
 
-    t0 = time.time()
-    proc, frame_size, width, height = leer_frames_ffmpeg(video_path, FPS_EXTRACT)
-    if proc is None or frame_size == 0:
-        video_meta.update({"status": "error"})
-        return video_meta
+    def _confirmar(self):
+        """Incorpora a la ventana el frame ya escrito en el slot libre."""
+        small = self.small_slots[self.pos]
+        if self.count == self.n:
+            oldest = (self.pos + 1) % (self.n + 1)
+            np.subtract(self.suma, self.small_slots[oldest], out=self.suma)
+        else:
+            self.count += 1
+        if self.small_size is not None:
+            cv2.resize(self.slots[self.pos], self.small_size, dst=small, interpolation=cv2.INTER_AREA)
+        np.add(self.suma, small, out=self.suma)
+        self.ultimo = self.pos
+        self.pos = (self.pos + 1) % (self.n + 1)
+        return self.slots[self.ultimo]
+
+    def agregar(self, frame):
+        """Incorpora un frame uint8 (copia); si la ventana está llena descarta el más antiguo."""
+        np.copyto(self.slots[self.pos], frame)
+        return self._confirmar()
+
+    def leer_de(self, fuente):
+        """Pide a la FrameSource el siguiente frame en el slot libre. Devuelve el frame o None al final."""
+        if not fuente.leer_en(self.slots[self.pos]):
+            return None
+        return self._confirmar()
+
+    def promedio_puntuacion(self):
+        """Promedio del buffer a resolución de puntuación (float32, buffer reutilizado)."""
+        np.divide(self.suma, self.count, out=self._avg)
+        return self._avg
+
+    def _puntuar_small(self, small):
+        np.subtract(small, self.promedio_puntuacion(), out=self._diff)
+        np.abs(self._diff, out=self._diff)
+        return self._diff.mean()
+
+    def puntuar(self):
+        """Métrica de movimiento del último frame agregado (como calcular_metrica_mov)."""
+        return self._puntuar_small(self.small_slots[self.ultimo])
+
+    def puntuar_frame(self, frame):
+        """Métrica de movimiento de un frame arbitrario contra el fondo actual."""
+        if self.small_size is not None:
+            frame = cv2.resize(frame, self.small_size, interpolation=cv2.INTER_AREA)
+        return self._puntuar_small(frame)
 
-    buffer = []
-    sum_buffer = np.zeros((height, width), dtype=np.float32)
+    def promedio(self):
+        """Promedio a resolución completa (solo para el resultado final)."""
+        suma = np.zeros(self.slots.shape[1:], dtype=np.float32)
+        for k in range(1, self.count + 1):
+            np.add(suma, self.slots[(self.pos - k) % (self.n + 1)], out=suma)
+        suma /= self.count
+        return suma
+
+
+def _indicadores_bloque(n, partes):
+    """Matriz (partes, n) float32 con 1 en las filas/columnas de cada bloque (bordes i*n//partes)."""
+    bordes = np.arange(partes + 1) * n // partes
+    idx = np.arange(n)
+    return ((idx >= bordes[:-1, None]) & (idx < bordes[1:, None])).astype(np.float32), np.diff(bordes)
+
+
+def calcular_mov_local_lote(frames, avg, grid=None, banda=32):
+    """
+    Movimiento local de varios frames contra `avg`: la máxima media de |frame - avg| por
+    bloque de una grilla (gh, gw), con los mismos bordes i*h//gh que la versión por parches.
+    Todos los frames se procesan juntos por franjas de `banda` filas (un solo buffer que
+    cabe en caché); las sumas por bloque son productos con matrices indicadoras, así que
+    el costo casi no depende del tamaño de la grilla. Devuelve un array de k puntajes.
+    """
+    if grid is None:
+        grid = (MOV_LOCAL_GRID, MOV_LOCAL_GRID)
+    frames = np.asarray(frames)
+    k, h, w = frames.shape
+    filas, alto = _indicadores_bloque(h, grid[0])
+    cols, ancho = _indicadores_bloque(w, grid[1])
+
+    buf = np.empty((k, min(banda, h), w), dtype=np.float32)
+    sumas = np.zeros((k, grid[0], w), dtype=np.float32)
+    for y in range(0, h, banda):
+        n = min(banda, h - y)
+        b = buf[:, :n]
+        np.subtract(frames[:, y:y + n], avg[y:y + n], out=b, dtype=np.float32)
+        np.abs(b, out=b)
+        sumas += filas[:, y:y + n] @ b
+    medias = (sumas @ cols.T) / np.outer(alto, ancho)
+    return medias.max(axis=(-2, -1))
+
+
+def calcular_mov_local(frame, avg, grid=None):
+    return float(calcular_mov_local_lote(frame[np.newaxis], avg, grid)[0])
+
+
+def cuantil_histograma(img, q, bins=256, rango=256.0):
+    """
+    Cuantil q (0..1) de `img` (uint8 o float32 en [0, rango)) con un histograma de `bins`
+    bins e interpolación lineal dentro del bin. Un pase O(n) en lugar del ordenamiento
+    parcial de np.percentile; el error es menor que el ancho de un bin.
+    """
+    hist = cv2.calcHist([img], [0], None, [bins], [0, rango]).ravel()
+    acum = np.cumsum(hist)
+    if acum[-1] == 0:
+        return 0.0
+    objetivo = q * (acum[-1] - 1)
+    b = int(np.searchsorted(acum, objetivo, side="right"))
+    b = min(b, bins - 1)
+    previo = acum[b - 1] if b > 0 else 0.0
+    ancho = rango / bins
+    fraccion = (objetivo - previo) / hist[b] if hist[b] else 0.0
+    return b * ancho + fraccion * ancho
+
+
+def construir_mascara(frame, avg, offset=MASK_OFFSET, saturado=MASK_SATURATED, reduccion=4):
+    """
+    Máscara de movimiento en gris (uint8) a 1/reduccion de la resolución: |frame - avg| menos
+    el offset, normalizada para que una fracción `saturado` de píxeles llegue a 255.
+    La saturación se aplica antes de reducir (como siempre), pero a resolución completa
+    solo quedan pasos elementales de cv2; el umbral sale de cuantil_histograma.
+    Usada por videos y ráfagas de fotos (guardar_salidas).
+    """
+    height, width = avg.shape
+    diff = cv2.absdiff(frame.astype(np.float32), avg.astype(np.float32, copy=False))
+    cv2.subtract(diff, float(offset), dst=diff)
+    np.maximum(diff, 0, out=diff)
+    umbral = cuantil_histograma(diff, 1 - saturado)
+    # convertScaleAbs satura a [0, 255] y deja uint8 en un solo pase
+    mask = cv2.convertScaleAbs(diff, alpha=255.0 / max(umbral, 1))
+    return cv2.resize(mask, (width // reduccion, height // reduccion), interpolation=cv2.INTER_AREA)
+
+
+def mascara_de_tops(top_frames, avg, reduccion=4):
+    """Máscara del top con mayor movimiento local (todos los tops en un lote), la que escribe guardar_salidas."""
+    best = int(np.argmax(calcular_mov_local_lote(top_frames, avg)))
+    return construir_mascara(top_frames[best], avg, reduccion=reduccion)
+
+
+def puntuar_rafaga(fuente, top_k=TOP_K, etapas=None):
+    """
+    Ráfaga de fotos desde una FrameSource (ImageSequenceSource): todas las fotos forman el
+    fondo (promedio uint8) y cada una se puntúa contra él a resolución completa, con los
+    mismos resultados que el cálculo original de procesar_grupo_de_fotos.
+    Devuelve (avg uint8, top_items) con top_items = [(score, indice, gris, color)].
+    """
+    etapas = etapas or Etapas()
+    imgs_gray = []
+    imgs_color = []
+    with etapas.medir("decode"):
+        buf = np.empty((fuente.height, fuente.width), dtype=np.uint8)
+        while fuente.leer_en(buf):
+            imgs_gray.append(buf.copy())
+            c = fuente.color_actual()
+            imgs_color.append(c.copy() if c is not None else None)
+    if not imgs_gray:
+        return None, []
+    with etapas.medir("score"):
+        avg = np.mean(imgs_gray, axis=0).astype(np.uint8)
+        avg_f = avg.astype(np.float32)
+        scores = [np.abs(img.astype(np.float32) - avg_f).mean() for img in imgs_gray]
+        top_indices = np.argsort(scores)[-top_k:][::-1]
+    top_items = [(scores[k], int(k), imgs_gray[k], imgs_color[k]) for k in top_indices]
+    return avg, top_items
+
+
+def mascara_rafaga(frame, avg):
+    """Máscara de una ráfaga: la del mejor top contra el promedio, como siempre (reducida a 1/4)."""
+    diff = np.abs(frame.astype(np.float32) - avg.astype(np.float32))
+    diff = diff - MASK_OFFSET
+    diff[diff < 0] = 0
+    if diff.size > 0:
+        umbral = np.percentile(diff.flatten(), 100 * (1 - MASK_SATURATED))
+        diff = np.clip(diff * 255 / max(umbral, 1), 0, 255)
+    mask_gray = diff.astype(np.uint8)
+    return cv2.resize(mask_gray, (mask_gray.shape[1] // 4, mask_gray.shape[0] // 4))
+
+
+def puntuar_fuente(fuente, guardar_frames=True, linea=None, cache_proxy=None,
+                   etapas=None, buffer_n=BUFFER_N, top_k=TOP_K, downsample_max=DOWNSAMPLE_MAX):
+    """
+    Motor de puntuación de videos, común a todas las FrameSource: fondo móvil de BUFFER_N
+    frames; cada frame se puntúa al llegar (las ráfagas de fotos usan puntuar_rafaga).
+    Con guardar_frames=False el top solo guarda índices.
+    Si se pasa una lista en `linea`, se le agrega el puntaje de cada frame;
+    con un ProxyWriter en `cache_proxy`, cada frame se guarda también reducido.
+    Con `etapas` (Etapas) separa el tiempo de lectura ("decode") del de puntuación ("score").
+    buffer_n, top_k y downsample_max permiten puntuar con otros parámetros (rescore.py).
+    Devuelve (fondo, top_items, total_frames), con top_items = [(score, indice, gris, color)]
+    ordenados de mayor a menor; color es None si la fuente no lo entrega.
+    """
+    etapas = etapas or Etapas()
+    fondo = FondoCircular(fuente.height, fuente.width, buffer_n, downsample_max)
+    n_slots = buffer_n + 1
+    # El top es solo (score, índice). El frame i vive en el slot i % n_slots del buffer
+    # circular hasta que se lee el frame i + n_slots: solo entonces, y solo si sigue en el
+    # top, se copia a uno de los top_k buffers de candidatos. Un frame que entra y sale
+    # del top dentro de la ventana nunca se copia.
     top_heap = []
+    en_top = set()
+    candidatos = {}
+    libres = []
+    # El color solo es válido hasta la siguiente lectura: se copia al entrar al top
+    colores_top = {}
+    libres_color = []
     total_frames = 0
+    t_decode = t_score = 0.0
 
+    while True:
+        t = time.perf_counter()
+        saliente = total_frames - n_slots
+        if guardar_frames and saliente in en_top and saliente not in candidatos:
+            buf = libres.pop() if libres else np.empty((fuente.height, fuente.width), dtype=np.uint8)
+            np.copyto(buf, fondo.slots[saliente % n_slots])
+            candidatos[saliente] = buf
+
+        frame = fondo.leer_de(fuente)
+        t_leido = time.perf_counter()
+        t_decode += t_leido - t
+        if frame is None:
+            break
+        idx = total_frames
+        total_frames += 1
+        if cache_proxy is not None:
+            small = fondo.small_slots[fondo.ultimo]
+            cache_proxy.agregar(small if small.shape == cache_proxy.shape else frame)
+
+        score = fondo.puntuar()
+        if linea is not None:
+            linea.append(score)
+        if len(top_heap) < top_k or score > top_heap[0][0]:
+            # El índice desempata y permite re-extraer o ubicar el frame
+            if len(top_heap) < top_k:
+                heapq.heappush(top_heap, (score, idx))
+            else:
+                _, fuera = heapq.heapreplace(top_heap, (score, idx))
+                en_top.discard(fuera)
+                if fuera in candidatos:
+                    libres.append(candidatos.pop(fuera))
+                if fuera in colores_top:
+                    libres_color.append(colores_top.pop(fuera))
+            en_top.add(idx)
+            c = fuente.color_actual() if guardar_frames else None
+            if c is not None:
+                color = libres_color.pop() if libres_color else np.empty_like(c)
+                np.copyto(color, c)
+                colores_top[idx] = color
+        t_score += time.perf_counter() - t_leido
+    etapas.sumar("decode", t_decode)
+    etapas.sumar("score", t_score)
+
+    # Materialización por posición: copia de candidato o, si sigue en la ventana, el slot
+    top_items = []
+    for score, idx in sorted(top_heap, key=lambda x: -x[0]):
+        gris = None
+        if guardar_frames:
+            gris = candidatos.get(idx)
+            if gris is None:
+                gris = fondo.slots[idx % n_slots]
+        top_items.append((score, idx, gris, colores_top.get(idx)))
+    return fondo, top_items, total_frames
+
+
+def abrir_fuente_video(video_path, width, height, escala=None, fps=FPS_EXTRACT):
+    """
+    FrameSource para un video según FRAME_BACKEND (el modo proxy siempre usa ffmpeg),
+    envuelta en PrefetchSource si PIPELINE_QUEUE > 0.
+    """
+    fuente = None
+    if FRAME_BACKEND == "cv2" and escala is None:
+        try:
+            fuente = CV2VideoSource(video_path, fps)
+        except Exception as e:
+            print(f"Advertencia: cv2 no abre {os.path.basename(video_path)}, se usa ffmpeg: {e}")
+    if fuente is None:
+        fuente = FFmpegPipeSource.abrir(video_path, fps, escala=escala, dims=(width, height))
+    if fuente is not None and PIPELINE_QUEUE > 0:
+        fuente = PrefetchSource(fuente, PIPELINE_QUEUE)
+    return fuente
+
+
+def registrar_pipeline(fuente, etapas):
+    """Guarda en `etapas` las esperas de cada lado del pipeline lector/puntuación (si lo hubo)."""
+    if etapas is not None and isinstance(fuente, PrefetchSource):
+        etapas.pipeline = {
+            "queue": PIPELINE_QUEUE,
+            "wait_read_sec": round(fuente.espera_lectura, 3),
+            "wait_score_sec": round(fuente.espera_puntuacion, 3)
+        }
+
+
+def leer_bytes_video(etapas, video_path, fraccion=1.0):
+    """Cuenta en `etapas` los bytes que lee una pasada de ffmpeg (fraccion < 1: ventana con -ss)."""
+    if etapas is not None:
+        try:
+            etapas.sumar_bytes("video", os.path.getsize(video_path) * min(1.0, fraccion))
+        except OSError:
+            pass
+
+
+def _escaneo_completo(video_path, width, height, cache_proxy=None, etapas=None):
+    """
+    Pasada estándar: puntúa todos los frames a FPS_EXTRACT (DECODE_MODE full o proxy).
+    Con `cache_proxy` (ProxyWriter) se guarda además cada frame reducido; en `etapas`
+    quedan tiempos por etapa, bytes leídos y esperas del pipeline.
+    Devuelve (avg_final, top_frames, top_color, top_times, total_frames, linea, paso_linea)
+    o None si falla; `linea` es la línea de tiempo de movimiento, array (N, 2) de
+    [segundo, puntaje], y `paso_linea` la duración que cubre su última muestra.
+    """
+    escala = tamano_puntuacion(height, width) if DECODE_MODE == "proxy" else None
+    proxy = escala is not None
+    fuente = abrir_fuente_video(video_path, width, height, escala)
+    if fuente is None:
+        return None
+
+    with fuente:
+        try:
+            scores = []
+            fondo, top_items, total_frames = puntuar_fuente(
+                fuente, linea=scores, cache_proxy=cache_proxy, etapas=etapas
+            )
+        except Exception as e:
+            print(f"Error leyendo frames de {os.path.basename(video_path)}: {e}")
+            return None
+        leer_bytes_video(etapas, video_path)
+        registrar_pipeline(fuente, etapas)
+
+        if total_frames == 0:
+            return None
+
+        idx_tops = [item[1] for item in top_items]
+        if proxy:
+            # Resolución completa solo para los tops (una búsqueda por top, a color) y la
+            # ventana final del fondo (una pasada corta desde su inicio)
+            inicio_fondo = max(0, total_frames - BUFFER_N)
+            t = time.perf_counter()
+            try:
+                color, ventana = releer_tops_y_fondo(
+                    video_path, [i / FPS_EXTRACT for i in idx_tops], inicio_fondo / FPS_EXTRACT,
+                    (total_frames - inicio_fondo) / FPS_EXTRACT, width, height
+                )
+            except Exception as e:
+                print(f"Error extrayendo frames de {os.path.basename(video_path)}: {e}")
+                color, ventana = {}, []
+            if etapas is not None:
+                etapas.sumar("topk", time.perf_counter() - t)
+            leer_bytes_video(etapas, video_path, (len(idx_tops) + total_frames - inicio_fondo) / total_frames)
+            top_color = [color.get(i / FPS_EXTRACT) for i in idx_tops]
+            # Lo que no se pudo releer queda con lo puntuado (gris reducido, ampliado), como
+            # el modo full deja en gris los tops sin color
+            faltan = sum(c is None for c in top_color)
+            if faltan or not ventana:
+                print(f"Advertencia: {os.path.basename(video_path)}: {faltan} tops"
+                      f"{' y el fondo' if not ventana else ''} desde la resolución reducida")
+            top_frames = [
+                cv2.cvtColor(c, cv2.COLOR_BGR2GRAY) if c is not None
+                else cv2.resize(item[2], (width, height), interpolation=cv2.INTER_LINEAR)
+                for c, item in zip(top_color, top_items)
+            ]
+            if ventana:
+                avg_final = promedio_ventana(ventana, width, height)
+            else:
+                avg_final = cv2.resize(fondo.promedio(), (width, height), interpolation=cv2.INTER_LINEAR)
+        else:
+            top_frames = [item[2] for item in top_items]
+            avg_final = fondo.promedio()
+
+            # Tops a color: las fuentes en proceso ya los traen; ffmpeg busca cada top por su segundo
+            top_color = [item[3] for item in top_items]
+            faltan = [i for i, c in zip(idx_tops, top_color) if c is None]
+            if COLOR_TOPS and faltan:
+                t = time.perf_counter()
+                try:
+                    extra = fuente.colores(faltan)
+                except Exception as e:
+                    print(f"Advertencia: tops en gris para {os.path.basename(video_path)}: {e}")
+                    extra = {}
+                if etapas is not None:
+                    etapas.sumar("topk", time.perf_counter() - t)
+                # Cada búsqueda lee aproximadamente un intervalo de muestreo del archivo
+                leer_bytes_video(etapas, video_path, len(faltan) / total_frames)
+                top_color = [c if c is not None else extra.get(i) for i, c in zip(idx_tops, top_color)]
+        if not COLOR_TOPS:
+            top_color = [None] * len(top_frames)
+    top_times = [i / FPS_EXTRACT for i in idx_tops]
+    linea = np.column_stack([np.arange(len(scores)) / FPS_EXTRACT, scores]).astype(np.float32)
+    return avg_final, top_frames, top_color, top_times, total_frames, linea, 1.0 / FPS_EXTRACT
+
+
+def leer_keyframes_ffmpeg(video_path, log_file):
+    """
+    Decodifica solo keyframes (-skip_frame nokey) en gris a resolución completa.
+    `showinfo` escribe el pts_time de cada frame en `log_file` (se lee al terminar).
+    """
+    cmd = [
+        "ffmpeg", "-skip_frame", "nokey", "-i", video_path,
+        "-vf", "showinfo,format=gray",
+        "-vsync", "0",
+        "-f", "image2pipe", "-vcodec", "rawvideo", "-"
+    ]
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=log_file)
+
+
+def leer_tiempos_showinfo(log_path):
+    """Lista de pts_time (en orden) de las líneas de showinfo."""
+    tiempos = []
+    with open(log_path, "r", errors="ignore") as f:
+        for line in f:
+            if "showinfo" in line and " n:" in line:
+                m = re.search(r"pts_time:\s*([-\d.]+)", line)
+                if m:
+                    tiempos.append(float(m.group(1)))
+    return tiempos
+
+
+def leer_ventana_ffmpeg(video_path, inicio, duracion, width, height, fps=1, color=True):
+    """
+    Decodifica completo (en BGR o gris, a `fps`) solo el tramo [inicio, inicio + duracion],
+    con las mismas muestras que la pasada completa (filtro_fps).
+    """
+    ss, desfase = busqueda(inicio)
+    cmd = [
+        "ffmpeg", "-ss", f"{ss:.6f}", "-i", video_path,
+        "-t", f"{duracion:.3f}",
+        "-vf", f"{filtro_fps(fps, desfase)},format={'bgr24' if color else 'gray'}",
+        "-f", "image2pipe", "-vcodec", "rawvideo", "-"
+    ]
+    shape = (height, width, 3) if color else (height, width)
+    frame_size = int(np.prod(shape))
+    frames = []
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
     try:
         while True:
             raw = proc.stdout.read(frame_size)
             if len(raw) < frame_size:
                 break
-            frame = np.frombuffer(raw, dtype=np.uint8).reshape((height, width))
-            total_frames += 1
+            frames.append(np.frombuffer(raw, dtype=np.uint8).reshape(shape))
+    finally:
+        proc.stdout.close()
+        proc.wait()
+    return [(max(0.0, inicio) + j / fps, f) for j, f in enumerate(frames)]
 
-            buffer.append(frame)
-            sum_buffer += frame.astype(np.float32)
-            if len(buffer) > BUFFER_N:
-                oldest = buffer.pop(0)
-                sum_buffer -= oldest.astype(np.float32)
 
-            avg = sum_buffer / len(buffer)
-            score = calcular_metrica_mov(frame, avg)
+def promedio_ventana(ventana, width, height):
+    """Promedio float32 de los frames gris de una ventana [(t, gris)] (el fondo final)."""
+    avg = np.zeros((height, width), dtype=np.float32)
+    for _, gris in ventana:
+        np.add(avg, gris, out=avg)
+    avg /= len(ventana)
+    return avg
+
+
+def releer_tops_y_fondo(video_path, tiempos, inicio_fondo, duracion_fondo, width, height, fps=FPS_EXTRACT):
+    """
+    Relee del video original, a resolución completa, lo que el modo proxy no tiene: los
+    tops en `tiempos` (BGR, una búsqueda -ss por top) y la ventana del fondo que empieza en
+    `inicio_fondo` (gris, a `fps`). Devuelve ({t: BGR}, [(t, gris)]).
+    """
+    color = extraer_frames_por_tiempo(video_path, tiempos, width, height)
+    ventana = leer_ventana_ffmpeg(video_path, inicio_fondo, duracion_fondo, width, height, fps, color=False)
+    return color, ventana
+
+
+def keyframes_conviene(codec):
+    """
+    False para códecs solo intra (p. ej. el MJPEG de muchas cámaras trampa): ahí cada frame
+    es keyframe y "keyframes" decodificaría y puntuaría más frames que "full".
+    """
+    return (codec or "").lower() not in CODECS_SOLO_INTRA
+
+
+def _escaneo_keyframes(video_path, width, height, etapas=None, duracion=None):
+    """
+    Escaneo rápido para clips largos: la línea de tiempo de movimiento se calcula solo
+    con keyframes y se decodifica completo únicamente alrededor de los TOP_K picos.
+    Devuelve lo mismo que _escaneo_completo (la línea de tiempo es la de los keyframes),
+    o None si falla o si el clip tiene al menos tantos keyframes como muestras a
+    FPS_EXTRACT en `duracion` (la lectura se corta ahí): el llamador usa la pasada completa.
+    """
+    limite = int(np.ceil(duracion * FPS_EXTRACT)) if duracion else None
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = os.path.join(tmp, "showinfo.log")
+        with open(log_path, "w") as log_file:
+            with FFmpegPipeSource(leer_keyframes_ffmpeg(video_path, log_file), width, height,
+                                  max_frames=limite) as fuente:
+                try:
+                    scores = []
+                    fondo, key_items, total_frames = puntuar_fuente(
+                        fuente, guardar_frames=False, linea=scores, etapas=etapas
+                    )
+                except Exception as e:
+                    print(f"Error leyendo keyframes de {os.path.basename(video_path)}: {e}")
+                    return None
+                if fuente.recortada:
+                    print(f"{os.path.basename(video_path)}: al menos un keyframe por muestra, "
+                          "el modo 'keyframes' no aventaja a la pasada completa")
+                    return None
+        tiempos = leer_tiempos_showinfo(log_path)
+
+    if total_frames == 0 or len(tiempos) < total_frames:
+        return None
+    leer_bytes_video(etapas, video_path)
+
+    # Ventanas [keyframe anterior, keyframe siguiente] alrededor de cada pico, fusionadas
+    ventanas = []
+    for k in sorted(item[1] for item in key_items):
+        ini = tiempos[k - 1] if k > 0 else tiempos[k]
+        fin = tiempos[k + 1] if k + 1 < total_frames else tiempos[k] + 1.0 / FPS_EXTRACT
+        if ventanas and ini <= ventanas[-1][1]:
+            ventanas[-1][1] = max(ventanas[-1][1], fin)
+        else:
+            ventanas.append([ini, fin])
+
+    top_items, n_ventanas = _puntuar_ventanas(
+        video_path, ventanas, width, height, fondo, FPS_EXTRACT, etapas, duracion=tiempos[-1]
+    )
+    if not top_items:
+        return None
+
+    top_frames = [item[2] for item in top_items]
+    top_color = [item[3] if COLOR_TOPS else None for item in top_items]
+    top_times = [item[1] for item in top_items]
+    # Línea de tiempo con los keyframes (espaciado irregular): el último keyframe cubre
+    # un GOP, el mismo intervalo que lo separa del anterior
+    linea = np.column_stack([tiempos[:len(scores)], scores]).astype(np.float32)
+    paso_linea = tiempos[len(scores) - 1] - tiempos[len(scores) - 2] if len(scores) > 1 else 1.0 / FPS_EXTRACT
+    return fondo.promedio(), top_frames, top_color, top_times, total_frames + n_ventanas, linea, paso_linea
+
+
+def _puntuar_ventanas(video_path, ventanas, width, height, fondo, fps, etapas=None, duracion=None):
+    """
+    Decodifica completas (a `fps`) las ventanas [ini, fin] y puntúa cada frame contra `fondo`.
+    Devuelve (top_items, frames decodificados), top_items = [(score, segundo, gris, color)]
+    ordenados de mayor a menor. El tiempo va a la etapa "topk" de `etapas`.
+    """
+    t0 = time.perf_counter()
+    top_heap = []
+    n = 0
+    for ini, fin in ventanas:
+        if duracion:
+            leer_bytes_video(etapas, video_path, (fin - ini) / duracion)
+        for t, color in leer_ventana_ffmpeg(video_path, ini, fin - ini, width, height, fps):
+            gray = cv2.cvtColor(color, cv2.COLOR_BGR2GRAY)
+            item = (fondo.puntuar_frame(gray), t, gray, color)
             if len(top_heap) < TOP_K:
-                heapq.heappush(top_heap, (score, frame.copy()))
-            else:
-                if score > top_heap[0][0]:
-                    heapq.heapreplace(top_heap, (score, frame.copy()))
-    except Exception as e:
-        print(f"Error leyendo frames de {os.path.basename(video_path)}: {e}")
-        proc.stdout.close()
-        proc.kill()
-        video_meta.update({"status": "error"})
-        return video_meta
+                heapq.heappush(top_heap, item)
+            elif item[0] > top_heap[0][0]:
+                heapq.heapreplace(top_heap, item)
+            n += 1
+    if etapas is not None:
+        etapas.sumar("topk", time.perf_counter() - t0)
+    return sorted(top_heap, key=lambda x: -x[0]), n
+
+
+def adaptativo_conviene(duracion):
+    """
+    True si en un clip de `duracion` s las ventanas finas del modo "adaptive" (un paso grueso
+    por pico, con el tope ADAPTIVE_REFINE_MAX) cubren como mucho ADAPTIVE_MAX_FRACTION del
+    clip; si no, "full" decodifica menos. Sin duración no se pueden ubicar las muestras gruesas.
+    """
+    if not duracion:
+        return False
+    cubierto = min(TOP_K / ADAPTIVE_FPS_COARSE, ADAPTIVE_REFINE_MAX / ADAPTIVE_FPS_FINE)
+    return cubierto <= ADAPTIVE_MAX_FRACTION * duracion
+
+
+def ventanas_refinado(picos, paso, fps_fino=ADAPTIVE_FPS_FINE, max_frames=ADAPTIVE_REFINE_MAX):
+    """
+    Ventanas [ini, fin] de ±medio `paso` alrededor de cada pico (score, segundo),
+    fusionadas si se solapan. Se toman en orden de puntaje hasta `max_frames` frames finos;
+    la que no entra completa se recorta alrededor de su pico. Devuelve (ventanas en orden
+    temporal, segundos cubiertos antes del recorte).
+    """
+    fusionadas = []
+    for score, t in sorted(picos, key=lambda x: x[1]):
+        ini, fin = max(0.0, t - 0.5 * paso), t + 0.5 * paso
+        if fusionadas and ini <= fusionadas[-1][1]:
+            v = fusionadas[-1]
+            v[1] = max(v[1], fin)
+            if score > v[2]:
+                v[2], v[3] = score, t
+        else:
+            fusionadas.append([ini, fin, score, t])
+    cubierto = sum(fin - ini for ini, fin, _, _ in fusionadas)
+
+    ventanas = []
+    restante = max_frames / fps_fino
+    for ini, fin, _, centro in sorted(fusionadas, key=lambda v: -v[2]):
+        if restante <= 0:
+            break
+        if fin - ini > restante:
+            ini = max(ini, centro - restante / 2)
+            fin = ini + restante
+        ventanas.append([ini, fin])
+        restante -= fin - ini
+    ventanas.sort()
+    return ventanas, cubierto
 
-    proc.stdout.close()
-    proc.wait()
 
+def _escaneo_adaptativo(video_path, width, height, etapas=None, duracion=None):
+    """
+    Muestreo de grueso a fino: puntúa el clip a ADAPTIVE_FPS_COARSE con una búsqueda por
+    muestra (SeekSource: solo se decodifica desde el keyframe previo a cada una) y decodifica
+    a ADAPTIVE_FPS_FINE solo el tramo de ±medio paso grueso alrededor de los TOP_K picos,
+    donde se eligen los tops definitivos (contra el fondo final, como en "keyframes").
+    Requiere `duracion` (ver adaptativo_conviene). Devuelve lo mismo que _escaneo_completo
+    (la línea de tiempo es la gruesa) o None si falla: el llamador usa la pasada completa.
+    """
+    paso = 1.0 / ADAPTIVE_FPS_COARSE
+    tiempos = np.arange(0.0, duracion, paso)
+    with SeekSource(video_path, tiempos, width, height) as fuente:
+        try:
+            scores = []
+            fondo, picos, total_frames = puntuar_fuente(
+                fuente, guardar_frames=False, linea=scores, etapas=etapas
+            )
+        except Exception as e:
+            print(f"Error leyendo frames de {os.path.basename(video_path)}: {e}")
+            return None
+        leidos = fuente.leidos
     if total_frames == 0:
-        video_meta.update({"status": "error"})
-        return video_meta
+        return None
+    # Cada búsqueda lee aproximadamente un GOP: se cuenta un segundo de archivo por muestra
+    leer_bytes_video(etapas, video_path, total_frames / duracion)
+
+    ventanas, _ = ventanas_refinado([(score, leidos[k]) for score, k, _, _ in picos], paso)
+    top_items, n_fino = _puntuar_ventanas(
+        video_path, ventanas, width, height, fondo, ADAPTIVE_FPS_FINE, etapas, duracion=duracion
+    )
+    if not top_items:
+        return None
+
+    top_frames = [item[2] for item in top_items]
+    top_color = [item[3] if COLOR_TOPS else None for item in top_items]
+    top_times = [item[1] for item in top_items]
+    linea = np.column_stack([leidos, scores]).astype(np.float32)
+    return fondo.promedio(), top_frames, top_color, top_times, total_frames + n_fino, linea, paso
+
+
+def guardar_linea_tiempo(output_folder, linea, paso_final=1.0 / FPS_EXTRACT, umbral=MOTION_THRESHOLD):
+    """
+    Guarda la línea de tiempo de movimiento en motion.npy (float32, filas [segundo, puntaje])
+    y devuelve (ruta, resumen) con máximo, media y segundos por encima de `umbral`.
+    Cada muestra cuenta hasta la siguiente; la última, `paso_final` segundos (el paso del
+    modo de escaneo que la generó).
+    """
+    path = os.path.join(output_folder, "motion.npy")
+    np.save(path, linea)
+    if len(linea) == 0:
+        return path, {"max": 0.0, "mean": 0.0, "seconds_above": 0.0, "threshold": umbral}
+    t, score = linea[:, 0], linea[:, 1]
+    dt = np.append(np.diff(t), paso_final)
+    resumen = {
+        "max": round(float(score.max()), 3),
+        "mean": round(float(score.mean()), 3),
+        "seconds_above": round(float(dt[score > umbral].sum()), 2),
+        "threshold": umbral
+    }
+    return path, resumen
+
+
+_pool_jpeg = None
+_pool_jpeg_pid = None
+
+
+def pool_jpeg():
+    """
+    ThreadPoolExecutor compartido para codificar JPEG (cv2.imwrite libera el GIL).
+    Se crea por proceso: un pool heredado por fork no tiene hilos vivos.
+    """
+    global _pool_jpeg, _pool_jpeg_pid
+    if JPEG_THREADS <= 0:
+        return None
+    if _pool_jpeg is None or _pool_jpeg_pid != os.getpid():
+        _pool_jpeg = ThreadPoolExecutor(max_workers=JPEG_THREADS, thread_name_prefix="jpeg")
+        _pool_jpeg_pid = os.getpid()
+    return _pool_jpeg
+
+
+def _imwrite_medido(path, img, params):
+    t = time.perf_counter()
+    if isinstance(img, bytes):
+        # JPEG ya codificado (top reutilizado al re-puntuar): se escribe sin recodificar
+        with open(path, "wb") as f:
+            f.write(img)
+    else:
+        cv2.imwrite(path, img, params)
+    return time.perf_counter() - t
+
+
+def guardar_salidas(output_folder, fecha_prefix, avg_final, top_frames, top_color, etapas=None,
+                    mascara=None, escribir_promedio=True):
+    """
+    Escribe promedio, tops (a color si hay) y máscara. Devuelve (promedio, tops, mask).
+    Las codificaciones van al pool de JPEG mientras se calcula la máscara; se espera a
+    que terminen todas antes de volver (los frames pueden ser slots del buffer circular).
+    En `etapas` quedan "mask" y "jpeg" (suma de las codificaciones, aunque vayan en paralelo).
+    Un top a color puede venir como bytes de un JPEG ya escrito (se copia tal cual).
+    `mascara` es una máscara ya calculada (ráfagas: mascara_rafaga). Con
+    escribir_promedio=False el promedio ya escrito se conserva (re-puntuado sin cambio de fondo).
+    """
+    etapas = etapas or Etapas()
+    pool = pool_jpeg()
+    pendientes = []
+
+    def escribir(path, img, calidad):
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), calidad]
+        if pool is None:
+            etapas.sumar("jpeg", _imwrite_medido(path, img, params))
+        else:
+            pendientes.append(pool.submit(_imwrite_medido, path, img, params))
 
-    avg_final = sum_buffer / len(buffer)
     promedio_path = os.path.join(output_folder, f"{fecha_prefix}_promedio.jpg")
-    cv2.imwrite(promedio_path, avg_final.astype(np.uint8), [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
+    if escribir_promedio:
+        escribir(promedio_path, avg_final.astype(np.uint8), JPEG_QUALITY)
 
-    top_frames_sorted = sorted(top_heap, key=lambda x: -x[0])
     top_paths = []
-    for idx, (_, f) in enumerate(top_frames_sorted, 1):
-        fname = os.path.join(output_folder, f"{fecha_prefix}_top_{idx:02d}.jpg")
-        cv2.imwrite(fname, f, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
+    for rank, (f, c) in enumerate(zip(top_frames, top_color), 1):
+        fname = os.path.join(output_folder, f"{fecha_prefix}_top_{rank:02d}.jpg")
+        escribir(fname, c if c is not None else f, JPEG_QUALITY)
         top_paths.append(fname)
 
-    # Selección del frame con mayor movimiento local
-    best_frame = top_frames_sorted[0][1].astype(np.float32)
-    max_local = -1
-    for _, f in top_frames_sorted:
-        local_score = calcular_mov_local(f.astype(np.float32), avg_final)
-        if local_score > max_local:
-            max_local = local_score
-            best_frame = f.astype(np.float32)
-
-    diff = best_frame - avg_final
-    mask_gray = mapear_mask_gris(diff)
-    mask_small = cv2.resize(mask_gray, (width // 4, height // 4), interpolation=cv2.INTER_AREA)
+    with etapas.medir("mask"):
+        mask_small = mascara if mascara is not None else mascara_de_tops(top_frames, avg_final)
     mask_path = os.path.join(output_folder, f"{fecha_prefix}_mask.jpg")
-    cv2.imwrite(mask_path, mask_small, [int(cv2.IMWRITE_JPEG_QUALITY), MASK_QUALITY])
+    escribir(mask_path, mask_small, MASK_QUALITY)
+
+    for futuro in pendientes:
+        etapas.sumar("jpeg", futuro.result())
+    return promedio_path, top_paths, mask_path
+
+
+def procesar_video(video_meta, output_root):
+    video_path = video_meta["video_path"]
+    v_hash = video_meta["video_hash"]
+    fecha_prefix = video_meta["fecha_prefix"]
+
+    frames_root = os.path.join(output_root, "frames")
+    output_folder = os.path.join(frames_root, v_hash)
+    os.makedirs(output_folder, exist_ok=True)
+
+    # ←←← REMOVIDO: la copia de fotos ya se hizo en escanear_videos()
+    # Asegurar que el campo original_photos exista (por compatibilidad)
+    if "original_photos" not in video_meta:
+        video_meta["original_photos"] = []
+    # →→→
+
+    t0 = time.time()
+    # Dimensiones ya sondeadas en escanear_videos (si no, se sondea aquí)
+    width, height = video_meta.get("width"), video_meta.get("height")
+    if not (width and height):
+        try:
+            width, height = obtener_dimensiones_video(video_path)
+        except Exception as e:
+            print(f"Error obteniendo dimensiones de {os.path.basename(video_path)}: {e}")
+            video_meta.update({"status": "error"})
+            return video_meta
+
+    etapas = Etapas()
+    duracion = video_meta.get("duration") or 0.0
+    scan_mode = SCAN_MODE
+    if scan_mode == "adaptive" and not adaptativo_conviene(duracion):
+        # Clip corto (o sin duración): las ventanas finas cubrirían casi todo
+        scan_mode = "full"
+    if scan_mode == "keyframes" and not keyframes_conviene(video_meta.get("codec")):
+        scan_mode = "full"
+    resultado = None
+    if scan_mode == "keyframes":
+        resultado = _escaneo_keyframes(video_path, width, height, etapas, duracion)
+        if resultado is None:
+            print(f"Advertencia: {os.path.basename(video_path)}: se usa la pasada completa")
+            scan_mode = "full"
+    elif scan_mode == "adaptive":
+        resultado = _escaneo_adaptativo(video_path, width, height, etapas, duracion)
+        if resultado is None:
+            print(f"Advertencia: {os.path.basename(video_path)}: se usa la pasada completa")
+            scan_mode = "full"
+    if scan_mode == "full":
+        # El proxy necesita la secuencia completa a FPS_EXTRACT: no aplica a "keyframes" ni "adaptive"
+        cache_proxy = None
+        if PROXY_CACHE:
+            size = tamano_puntuacion(height, width, PROXY_MAX) or (width, height)
+            cache_proxy = ProxyWriter(output_root, v_hash, size, FPS_EXTRACT, (width, height))
+        try:
+            resultado = _escaneo_completo(video_path, width, height, cache_proxy, etapas)
+        finally:
+            # Un error (o una excepción) no deja el .tmp del proxy a medias
+            if cache_proxy is not None:
+                if resultado is None:
+                    cache_proxy.descartar()
+                else:
+                    cache_proxy.finalizar()
+    if resultado is None:
+        video_meta.update({"status": "error"})
+        return video_meta
+    avg_final, top_frames, top_color, top_times, total_frames, linea, paso_linea = resultado
+
+    promedio_path, top_paths, mask_path = guardar_salidas(
+        output_folder, fecha_prefix, avg_final, top_frames, top_color, etapas
+    )
+    motion_path, motion_resumen = guardar_linea_tiempo(output_folder, linea, paso_linea)
 
     t1 = time.time()
+    # Etapas de escanear_videos (sondeo, hash, copia de fotos) + las de este procesamiento
+    medidas = etapas.como_dict()
+    timings = dict(video_meta.get("timings") or {})
+    timings.update(medidas["timings"])
+    bytes_read = dict(video_meta.get("bytes_read") or {})
+    bytes_read.update(medidas["bytes_read"])
+    # Rendimiento del modo de escaneo: segundos de video procesados por segundo real
     video_meta.update({
         "promedio": promedio_path,
         "mask": mask_path,
         "tops": top_paths,
+        "top_timestamps": [round(t, 3) for t in top_times],
+        "motion": motion_path,
+        "motion_summary": motion_resumen,
         "status": "done",
         "frames": total_frames,
         "time_sec": round(t1 - t0, 2),
+        "scan_mode": scan_mode,
+        "score_params": {"buffer_n": BUFFER_N, "top_k": TOP_K, "downsample_max": DOWNSAMPLE_MAX},
+        "throughput": round(duracion / (t1 - t0), 2) if duracion and t1 > t0 else None,
+        "pipeline": etapas.pipeline,
+        "timings": timings,
+        "bytes_read": bytes_read,
         "tags": [],
         "behaviors": []
     })
     return video_meta
 
+
+def _tops_reutilizables(video_meta, output_folder):
+    """{segundo: bytes JPEG} de los tops ya escritos, por su top_timestamp (redondeado a ms)."""
+    previos = {}
+    for t, path in zip(video_meta.get("top_timestamps") or [], video_meta.get("tops") or []):
+        try:
+            with open(os.path.join(output_folder, os.path.basename(path)), "rb") as f:
+                previos[round(t, 3)] = f.read()
+        except OSError:
+            pass
+    return previos
+
+
+def reprocesar_desde_proxy(video_meta, output_root, buffer_n=BUFFER_N, top_k=TOP_K,
+                           downsample_max=DOWNSAMPLE_MAX):
+    """
+    Vuelve a puntuar desde el proxy en caché con otros parámetros (buffer_n, top_k,
+    downsample_max): puntajes, elección de tops y línea de tiempo salen solo del proxy.
+    Las imágenes siguen a resolución completa y se rehacen solo si cambian: un top que ya
+    tenía imagen en el mismo segundo se reutiliza sin recodificar, y promedio y máscara
+    quedan como estaban si no cambian buffer_n ni el conjunto de tops. Si cambian, se relee
+    del video (una búsqueda por top y la ventana final del fondo), como el modo proxy.
+    El tiempo queda en "rescore_time_sec"; "time_sec" sigue siendo el del procesamiento.
+    Conserva tags, comportamientos y notas. Devuelve la entrada actualizada o None si no
+    hay proxy; FileNotFoundError si hace falta el video y ya no está (tarjeta desmontada).
+    """
+    v_hash = video_meta["video_hash"]
+    abierto = abrir_proxy(output_root, v_hash)
+    if abierto is None:
+        return None
+    frames, meta = abierto
+    video_path = video_meta["video_path"]
+    fecha_prefix = video_meta["fecha_prefix"]
+    width, height = meta["source_width"], meta["source_height"]
+    fps = meta["fps"]
+    output_folder = os.path.join(output_root, "frames", v_hash)
+    os.makedirs(output_folder, exist_ok=True)
+
+    t0 = time.time()
+    scores = []
+    _, top_items, total_frames = puntuar_fuente(
+        ProxySource(frames), guardar_frames=False, linea=scores,
+        buffer_n=buffer_n, top_k=top_k, downsample_max=downsample_max
+    )
+    if total_frames == 0:
+        return None
+
+    top_times = [round(item[1] / fps, 3) for item in top_items]
+    previos = _tops_reutilizables(video_meta, output_folder)
+    # Entradas sin score_params se procesaron con los valores de config.ini
+    cambia_fondo = (video_meta.get("score_params") or {}).get("buffer_n", BUFFER_N) != buffer_n
+    cambian_tops = any(t not in previos for t in top_times) or len(previos) != len(top_times)
+    if cambia_fondo or cambian_tops:
+        if not os.path.exists(video_path):
+            raise FileNotFoundError(video_path)
+        inicio_fondo = max(0, total_frames - buffer_n)
+        color, ventana = releer_tops_y_fondo(
+            video_path, top_times, inicio_fondo / fps, (total_frames - inicio_fondo) / fps, width, height, fps
+        )
+        if len(color) < len(top_times) or not ventana:
+            raise IOError(f"no se pudieron releer los tops o el fondo de {os.path.basename(video_path)}")
+        top_frames = [cv2.cvtColor(color[t], cv2.COLOR_BGR2GRAY) for t in top_times]
+        top_color = [previos.get(t, color[t] if COLOR_TOPS else None) for t in top_times]
+        promedio_path, top_paths, mask_path = guardar_salidas(
+            output_folder, fecha_prefix, promedio_ventana(ventana, width, height), top_frames, top_color,
+            escribir_promedio=cambia_fondo
+        )
+    else:
+        # Mismos tops y mismo fondo: promedio y máscara no cambian, los tops a lo sumo de orden
+        top_paths = []
+        for rank, t in enumerate(top_times, 1):
+            fname = os.path.join(output_folder, f"{fecha_prefix}_top_{rank:02d}.jpg")
+            _imwrite_medido(fname, previos[t], None)
+            top_paths.append(fname)
+        promedio_path, mask_path = video_meta["promedio"], video_meta["mask"]
+    linea = np.column_stack([np.arange(len(scores)) / fps, scores]).astype(np.float32)
+    motion_path, motion_resumen = guardar_linea_tiempo(output_folder, linea, 1.0 / fps)
+
+    # Tops que sobraban de un top_k mayor
+    for rank in range(len(top_paths) + 1, 100):
+        sobrante = os.path.join(output_folder, f"{fecha_prefix}_top_{rank:02d}.jpg")
+        if not os.path.exists(sobrante):
+            break
+        os.remove(sobrante)
+
+    video_meta.update({
+        "promedio": promedio_path,
+        "mask": mask_path,
+        "tops": top_paths,
+        "top_timestamps": top_times,
+        "motion": motion_path,
+        "motion_summary": motion_resumen,
+        "frames": total_frames,
+        "score_params": {"buffer_n": buffer_n, "top_k": top_k, "downsample_max": downsample_max},
+        "rescore_time_sec": round(time.time() - t0, 2)
+    })
+    return video_meta
+
+
+def resumen_throughput(metadata_list):
+    """
+    Rendimiento medio por modo de escaneo en una lista de metadatos:
+    {modo: {"videos": n, "throughput": seg. de video por seg. real}}.
+    """
+    por_modo = {}
+    for m in metadata_list:
+        if m.get("status") != "done" or not m.get("throughput"):
+            continue
+        por_modo.setdefault(m.get("scan_mode", "full"), []).append(m["throughput"])
+    return {
+        modo: {"videos": len(vals), "throughput": round(sum(vals) / len(vals), 2)}
+        for modo, vals in por_modo.items()
+    }
+
+def reporte_etapas(metadata_list):
+    """
+    Agregado de sesión de "timings" y "bytes_read": totales y media por video de cada etapa,
+    fracción del tiempo total, bytes leídos, esperas del pipeline y rendimiento por modo.
+    """
+    totales, bytes_read, pipeline = {}, {}, {}
+    n = 0
+    for m in metadata_list:
+        timings = m.get("timings")
+        if m.get("status") != "done" or not timings:
+            continue
+        n += 1
+        for etapa, seg in timings.items():
+            totales[etapa] = totales.get(etapa, 0.0) + seg
+        for origen, b in (m.get("bytes_read") or {}).items():
+            bytes_read[origen] = bytes_read.get(origen, 0) + b
+        for clave, seg in (m.get("pipeline") or {}).items():
+            if clave.startswith("wait_"):
+                pipeline[clave] = pipeline.get(clave, 0.0) + seg
+    suma = sum(totales.values())
+    return {
+        "items": n,
+        "total_sec": {k: round(v, 2) for k, v in totales.items()},
+        "mean_sec": {k: round(v / n, 3) for k, v in totales.items()} if n else {},
+        "share": {k: round(v / suma, 3) for k, v in totales.items()} if suma else {},
+        "bytes_read": bytes_read,
+        "pipeline_wait_sec": {k: round(v, 2) for k, v in pipeline.items()},
+        "throughput": resumen_throughput(metadata_list)
+    }
+
+
+def guardar_reporte_etapas(metadata_list, path):
+    """Escribe reporte_etapas() como JSON (p. ej. sessions/<id>/timing_report.json)."""
+    reporte = reporte_etapas(metadata_list)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(reporte, f, indent=4)
+    return reporte
+
+
 def wrapper(args):
     try:
         return procesar_video(*args)
@@ -243,92 +1174,201 @@ def wrapper(args):
         return args[0]
 
 
+def wrapper_rescore(args):
+    """
+    Como wrapper, para Pool: args = (entrada, output_root, parámetros de reprocesar_desde_proxy).
+    Devuelve (entrada, motivo): motivo None si se re-puntuó; si no, "sin proxy", "sin video"
+    o "error", sin marcar la entrada como error.
+    """
+    video_meta, output_root, parametros = args
+    try:
+        res = reprocesar_desde_proxy(video_meta, output_root, **parametros)
+        return (res, None) if res is not None else (video_meta, "sin proxy")
+    except FileNotFoundError:
+        print(f"[rescore] Falta el video original (¿tarjeta desmontada?): {video_meta.get('video_path')}")
+        return video_meta, "sin video"
+    except Exception as e:
+        print(f"Error re-puntuando {video_meta.get('video_path')}: {e}")
+        return video_meta, "error"
+
+
 # ←←← NUEVA FUNCIÓN: escanea videos e imágenes y los asocia por timestamp
-def escanear_videos(input_folder, output_root):
+def _hash_y_sondeo(archivo, probe_cache, huella=None):
+    """
+    Hash, sondeo y fecha de un video del escaneo. Solo I/O y ffprobe: corre en los hilos del escaneo.
+    Con `huella` (entrada del índice de huellas para el mismo stat) no se vuelve a leer el video.
+    """
+    etapas = Etapas()
+    if huella is not None:
+        v_hash = huella["hash"]
+    else:
+        with etapas.medir("hash"):
+            v_hash = compute_video_hash(archivo.path, file_size=archivo.size)
+        etapas.sumar_bytes("hash", bytes_hash_video(archivo.path, file_size=archivo.size))
+    with etapas.medir("probe"):
+        info = get_video_info(archivo.path, probe_cache, stat=archivo.stat)
+        if huella is not None and huella.get("fecha_prefix"):
+            fecha_prefix = huella["fecha_prefix"]
+        else:
+            fecha_prefix = obtener_fecha_video(archivo.path, info)
+    return v_hash, info, fecha_prefix, etapas
+
+
+def buscar_artefactos(frames_folder, fecha_prefix):
+    """
+    Salidas ya generadas para un video: {"promedio", "mask", "tops"} si están el promedio,
+    la máscara y al menos el primer top; None si hay que procesarlo.
+    """
+    if not os.path.isdir(frames_folder):
+        return None
+    promedio_path = os.path.join(frames_folder, f"{fecha_prefix}_promedio.jpg")
+    mask_path = os.path.join(frames_folder, f"{fecha_prefix}_mask.jpg")
+    tops = []
+    for i in range(1, TOP_K + 1):
+        top_path = os.path.join(frames_folder, f"{fecha_prefix}_top_{i:02d}.jpg")
+        if not os.path.exists(top_path):
+            break
+        tops.append(top_path)
+    if not (tops and os.path.exists(promedio_path) and os.path.exists(mask_path)):
+        return None
+    return {"promedio": promedio_path, "mask": mask_path, "tops": tops}
+
+
+def artefactos_vigentes(artefactos):
+    """
+    True si las salidas registradas en el índice de huellas siguen en disco y son TOP_K tops
+    (un rescore con otro TOP_K o un borrado manual las dejan viejas).
+    """
+    tops = artefactos.get("tops") or []
+    if len(tops) != TOP_K:
+        return False
+    return all(p and os.path.exists(p) for p in [artefactos.get("promedio"), artefactos.get("mask")] + tops)
+
+
+def cargar_caches_escaneo(output_root):
+    """(caché de sondeo, índice de huellas) para varias llamadas a escanear_videos(caches=...)."""
+    return load_probe_cache(output_root), load_fingerprint_index(output_root)
+
+
+def guardar_caches_escaneo(caches, output_root):
+    probe_cache, indice = caches
+    try:
+        save_probe_cache(probe_cache, output_root)
+    except Exception as e:
+        print(f"Advertencia: no se pudo guardar la caché de sondeo: {e}")
+    try:
+        save_fingerprint_index(indice, output_root)
+    except Exception as e:
+        print(f"Advertencia: no se pudo guardar el índice de huellas: {e}")
+
+
+def escanear_videos(input_folder, output_root, progreso=None, existentes=None, huellas=None,
+                    archivos=None, caches=None):
     """
     Escanea videos e imágenes, calcula hash único por video,
     y reutiliza procesamiento previo si ya existe.
+    El hash y el sondeo corren en SCAN_THREADS hilos; los metadatos quedan en el orden
+    del escaneo. `progreso(hechos, total)` se llama a medida que termina cada video.
+    Los videos cuyo stat coincide con el índice de huellas (output/cache/fingerprints.json)
+    no se vuelven a leer: hash, fecha y salidas ya procesadas salen del índice.
+    Ingesta incremental: con `existentes` (entradas de una sesión) solo se devuelven los
+    videos nuevos o modificados; los que ya están, por huella o por hash, se omiten.
+    `huellas` agrega entradas al índice (p. ej. hashes calculados durante la copia de staging).
+    `archivos=(videos, imagenes)` (listas de ArchivoEscaneado) reemplaza el recorrido de
+    input_folder, p. ej. solo los videos recién copiados en staging. Con `caches` (de
+    cargar_caches_escaneo) la caché de sondeo y el índice no se leen ni se guardan aquí:
+    el llamador los guarda una vez al final (guardar_caches_escaneo).
     Devuelve solo la lista de metadatos (sin guardar archivo temporal).
     """
-    video_exts = ("*.AVI", "*.avi", "*.MP4", "*.mp4", "*.MOV", "*.mov", "*.MKV", "*.mkv")
-    img_exts = ("*.JPG", "*.jpg", "*.JPEG", "*.jpeg", "*.PNG", "*.png")
+    # Una sola pasada por todo el árbol (subcarpetas DCIM/1xxMEDIA incluidas); el stat de
+    # cada archivo se reutiliza para el hash, el sondeo y la asociación
+    videos, imagenes = archivos if archivos is not None else escanear_carpeta(input_folder, excluir=(output_root,))
+    claves = [clave_huella(a.path, a.stat) for a in videos]
 
-    video_files = []
-    for ext in video_exts:
-        video_files.extend(glob.glob(os.path.join(input_folder, ext)))
-    video_files = sorted(list(set(video_files)))  # orden y sin duplicados
+    # Huellas de la sesión: un archivo sin cambios se descarta antes de leerlo
+    huellas_sesion, hashes_sesion = set(), set()
+    if existentes:
+        huellas_sesion = {e["fingerprint"] for e in existentes if e.get("fingerprint")}
+        hashes_sesion = {e["video_hash"] for e in existentes if e.get("video_hash")}
+        nuevos = [(a, c) for a, c in zip(videos, claves) if c not in huellas_sesion]
+        videos = [a for a, _ in nuevos]
+        claves = [c for _, c in nuevos]
+    video_files = [a.path for a in videos]
 
-    img_files = []
-    for ext in img_exts:
-        img_files.extend(glob.glob(os.path.join(input_folder, ext)))
-    img_files = list(set(img_files))
+    # Un único sondeo por video, con caché persistente en output/cache/
+    propias = caches is None
+    probe_cache, indice = cargar_caches_escaneo(output_root) if propias else caches
 
-    def get_timestamp(path):
-        try:
-            if any(path.lower().endswith(ext.lower()) for ext in video_exts):
-                cmd = [
-                    "ffprobe", "-v", "quiet",
-                    "-print_format", "json",
-                    "-show_entries", "format_tags=creation_time",
-                    path
-                ]
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-                info = json.loads(result.stdout)
-                fecha = info.get("format", {}).get("tags", {}).get("creation_time")
-                if fecha:
-                    dt = datetime.fromisoformat(fecha.replace("Z", "+00:00"))
-                    return dt.timestamp()
-        except Exception:
-            pass
-        return os.path.getmtime(path)
+    # Videos y fotos se asocian por fecha de modificación: la rama ffprobe anterior
+    # comparaba contra "*.ext" y nunca se activaba, así que se mantiene ese criterio.
+    # Índice de fotos por timestamp, orden estable (ts, ruta)
+    pares = sorted((a.mtime, a.path) for a in imagenes)
+    img_files = [f for _, f in pares]
+    img_timestamps = np.array([ts for ts, _ in pares], dtype=np.float64)
+
+    # Asociación de todos los videos en una sola búsqueda: las fotos de un video son las
+    # PHOTOS_PER_VIDEO anteriores al primer timestamp posterior al suyo
+    video_timestamps = np.array([a.mtime for a in videos], dtype=np.float64)
+    fin_fotos = np.searchsorted(img_timestamps, video_timestamps, side="right")
 
-    # Ordenar imágenes por timestamp
-    img_files.sort(key=get_timestamp)
-    img_timestamps = [get_timestamp(f) for f in img_files]
+    # Hash + sondeo en paralelo: cada uno espera sobre todo latencia de lectura.
+    # Los que ya están en el índice de huellas solo consultan la caché de sondeo.
+    if huellas:
+        indice.update(huellas)
+    hashes = [None] * len(videos)
+    with ThreadPoolExecutor(max_workers=max(1, min(SCAN_THREADS, len(videos))),
+                            thread_name_prefix="scan") as pool:
+        futuros = {
+            pool.submit(_hash_y_sondeo, a, probe_cache, indice.get(clave)): i
+            for i, (a, clave) in enumerate(zip(videos, claves))
+        }
+        for hechos, futuro in enumerate(as_completed(futuros), 1):
+            hashes[futuros[futuro]] = futuro.result()
+            if progreso is not None:
+                progreso(hechos, len(videos))
 
     # Carpeta base de frames
     frames_root = os.path.join(output_root, "frames")
 
     metadata = []
-    for v in video_files:
-        # 1. Calcular hash único
-        v_hash = compute_video_hash(v)
-        
-        # 2. Obtener fecha para nombres de archivo (solo para legibilidad interna)
-        fecha_prefix = obtener_fecha_video(v)
+    for v, clave, fin, (v_hash, info, fecha_prefix, etapas) in zip(video_files, claves, fin_fotos, hashes):
+        # 1-2. Hash único y fecha para nombres de archivo (ya calculados en los hilos).
+        # Mismo contenido que un video de la sesión (entrada sin huella, o movido de ruta)
+        if v_hash in hashes_sesion:
+            continue
         try:
             recorded_dt = datetime.strptime(fecha_prefix, "%y%m%d_%H%M%S")
             recorded_at = recorded_dt.strftime("%Y-%m-%d %H:%M:%S")
         except Exception:
             recorded_at = ""
 
-        # 3. Verificar si ya fue procesado
-        expected_folder = os.path.join(frames_root, v_hash)
-        already_done = False
-        if os.path.isdir(expected_folder):
-            # Verificar presencia de archivos clave
-            promedio_path = os.path.join(expected_folder, f"{fecha_prefix}_promedio.jpg")
-            mask_path = os.path.join(expected_folder, f"{fecha_prefix}_mask.jpg")
-            top0_path = os.path.join(expected_folder, f"{fecha_prefix}_top_01.jpg")
-            if os.path.exists(promedio_path) and os.path.exists(mask_path) and os.path.exists(top0_path):
-                already_done = True
+        # 3. Verificar si ya fue procesado: primero el índice, si sus salidas siguen en disco;
+        # si no (o si estaba pendiente: pudo procesarse en otra sesión) se buscan en disco
+        huella = indice.get(clave)
+        if (huella and huella.get("status") == "done" and huella.get("artifacts")
+                and artefactos_vigentes(huella["artifacts"])):
+            artefactos = huella["artifacts"]
+        else:
+            artefactos = buscar_artefactos(os.path.join(frames_root, v_hash), fecha_prefix)
+        already_done = artefactos is not None
+        indice[clave] = {
+            "hash": v_hash,
+            "fecha_prefix": fecha_prefix,
+            "artifacts": artefactos,
+            "status": "done" if already_done else "pending"
+        }
 
         # 4. Asociar fotos (solo si es necesario, aunque ya esté procesado)
-        v_ts = get_timestamp(v)
         associated_photos = []
         if PHOTOS_PER_VIDEO > 0:
-            # Buscar las últimas N fotos antes del video
-            for i in range(len(img_files) - 1, -1, -1):
-                if len(associated_photos) >= PHOTOS_PER_VIDEO:
-                    break
-                if img_timestamps[i] <= v_ts:
-                    associated_photos.append(img_files[i])
-            associated_photos.reverse()  # más antigua primero
+            # Las últimas N fotos hasta el video, la más antigua primero
+            associated_photos = img_files[max(0, int(fin) - PHOTOS_PER_VIDEO):int(fin)]
 
         # 5. Construir metadato base
         meta_entry = {
             "video_path": v,
             "video_hash": v_hash,
+            "fingerprint": clave,
             "frames_folder": v_hash,
             "fecha_prefix": fecha_prefix,
             "associated_photos": associated_photos,
@@ -342,7 +1382,12 @@ def escanear_videos(input_folder, output_root):
             "subsite": "",
             "camera": "",
             "operator": "",
-            "recorded_at": recorded_at
+            "recorded_at": recorded_at,
+            "width": info.get("width"),
+            "height": info.get("height"),
+            "duration": info.get("duration"),
+            "fps": info.get("fps"),
+            "codec": info.get("codec")
         }
 
         # ←←← NUEVO: copiar fotos originales INMEDIATAMENTE y guardar rutas
@@ -350,33 +1395,31 @@ def escanear_videos(input_folder, output_root):
         if associated_photos:
             output_folder = os.path.join(frames_root, v_hash)
             os.makedirs(output_folder, exist_ok=True)
-            for idx, photo_path in enumerate(associated_photos, 1):
-                if os.path.exists(photo_path):
-                    ext = os.path.splitext(photo_path)[1]
-                    dest_name = f"original_{idx:02d}{ext.lower()}"
-                    dest_path = os.path.join(output_folder, dest_name)
-                    if not os.path.exists(dest_path):
-                        shutil.copy2(photo_path, dest_path)
-                    copied_photo_paths.append(dest_path)
+            with etapas.medir("photo_copy"):
+                for idx, photo_path in enumerate(associated_photos, 1):
+                    if os.path.exists(photo_path):
+                        ext = os.path.splitext(photo_path)[1]
+                        dest_name = f"original_{idx:02d}{ext.lower()}"
+                        dest_path = os.path.join(output_folder, dest_name)
+                        if not os.path.exists(dest_path):
+                            shutil.copy2(photo_path, dest_path)
+                            etapas.sumar_bytes("photo_copy", os.path.getsize(dest_path))
+                        copied_photo_paths.append(dest_path)
         meta_entry["original_photos"] = copied_photo_paths
+        meta_entry.update(etapas.como_dict())
         # →→→ FIN NUEVO
 
         # 6. Si ya está procesado, rellenar rutas de frames/máscara
         if already_done:
-            meta_entry["promedio"] = promedio_path
-            meta_entry["mask"] = mask_path
-            # Buscar todos los tops
-            tops = []
-            for i in range(1, TOP_K + 1):
-                top_path = os.path.join(expected_folder, f"{fecha_prefix}_top_{i:02d}.jpg")
-                if os.path.exists(top_path):
-                    tops.append(top_path)
-                else:
-                    break
-            meta_entry["tops"] = tops
+            meta_entry["promedio"] = artefactos["promedio"]
+            meta_entry["mask"] = artefactos["mask"]
+            meta_entry["tops"] = list(artefactos["tops"])
 
         metadata.append(meta_entry)
 
+    if propias:
+        guardar_caches_escaneo((probe_cache, indice), output_root)
+
     return metadata  # ←←← solo devuelve la lista
 
 # ===================================================================
@@ -392,30 +1435,25 @@ import os
 import hashlib
 
 
-def obtener_fotos_con_timestamp(input_folder):
+def obtener_fotos_con_timestamp(input_folder, excluir=()):
     """
-    Escanea una carpeta y devuelve una lista de dicts ordenada por timestamp:
-    [{"path": "...", "ts": timestamp_float}, ...]
+    Escanea una carpeta (y sus subcarpetas, salvo las de `excluir`) y devuelve una lista
+    de dicts ordenada por timestamp: [{"path": "...", "ts": timestamp_float}, ...]
     """
-    img_exts = {'.jpg', '.jpeg', '.png', '.JPG', '.JPEG', '.PNG'}
-    paths = []
-    for f in os.listdir(input_folder):
-        full_path = os.path.join(input_folder, f)
-        if os.path.isfile(full_path) and os.path.splitext(f)[1] in img_exts:
-            paths.append(full_path)
+    _, imagenes = escanear_carpeta(input_folder, excluir=excluir)
 
     fotos = []
-    for p in paths:
-        ts = obtener_timestamp_foto(p)
-        fotos.append({"path": p, "ts": ts})
+    for a in imagenes:
+        ts = obtener_timestamp_foto(a.path, mtime=a.mtime)
+        fotos.append({"path": a.path, "ts": ts})
     
     # Ordenar por timestamp
     fotos.sort(key=lambda x: x["ts"])
     return fotos
 
 
-def obtener_timestamp_foto(filepath):
-    """Extrae timestamp de EXIF o usa fecha de modificación."""
+def obtener_timestamp_foto(filepath, mtime=None):
+    """Extrae timestamp de EXIF o usa fecha de modificación (`mtime` si ya se conoce)."""
     try:
         with open(filepath, 'rb') as f:
             tags = exifread.process_file(f, stop_tag='DateTimeOriginal', details=False)
@@ -425,7 +1463,7 @@ def obtener_timestamp_foto(filepath):
                 return dt.timestamp()
     except Exception:
         pass
-    return os.path.getmtime(filepath)
+    return mtime if mtime is not None else os.path.getmtime(filepath)
 
 
 def agrupar_en_rafagas(fotos_con_ts, umbral_seg=2.0):
@@ -491,8 +1529,11 @@ def procesar_grupo_de_fotos(grupo, output_root):
     Procesa una ráfaga de fotos (1 o más) como si fuera un video.
     Genera: promedio.jpg, mask.jpg, top_01.jpg, ..., original_01.jpg, etc.
     """
+    etapas = Etapas()
     # 1. Hash único basado en la primera foto del grupo
-    grupo_hash = compute_file_hash(grupo[0]["path"])
+    with etapas.medir("hash"):
+        grupo_hash = compute_file_hash(grupo[0]["path"])
+    etapas.sumar_bytes("hash", bytes_hash_video(grupo[0]["path"]))
     frames_folder = os.path.join(output_root, "frames", grupo_hash)
     os.makedirs(frames_folder, exist_ok=True)
     
@@ -501,57 +1542,17 @@ def procesar_grupo_de_fotos(grupo, output_root):
     copied_paths = [foto["path"] for foto in grupo]
 
     
-    # 3. Cargar imágenes en escala de grises (solo una vez)
-    imgs_gray = []
-    imgs_color = []  # para guardar tops a color
-    for p in copied_paths:
-        img_color = cv2.imread(p)
-        if img_color is not None:
-            img_gray = cv2.cvtColor(img_color, cv2.COLOR_BGR2GRAY)
-            imgs_gray.append(img_gray)
-            imgs_color.append(img_color)
-        else:
-            # Imagen de respaldo si falla la lectura
-            if imgs_gray:
-                h, w = imgs_gray[-1].shape
-            else:
-                h, w = 480, 640
-            imgs_gray.append(np.zeros((h, w), dtype=np.uint8))
-            imgs_color.append(np.zeros((h, w, 3), dtype=np.uint8))
-    
-    # 4. Calcular promedio
-    avg = np.mean(imgs_gray, axis=0).astype(np.uint8)
+    # 3-7. Mismo motor que los videos: la ráfaga es una FrameSource cuyo fondo son todas las fotos
     fecha_prefix = datetime.fromtimestamp(grupo[0]["ts"]).strftime("%y%m%d_%H%M%S")
-    promedio_path = os.path.join(frames_folder, f"{fecha_prefix}_promedio.jpg")
-    cv2.imwrite(promedio_path, avg, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
-    
-    # 5. Calcular scores de movimiento
-    scores = []
-    for img in imgs_gray:
-        diff = np.abs(img.astype(np.float32) - avg.astype(np.float32))
-        scores.append(diff.mean())
-    
-    # 6. Seleccionar TOP_K
-    top_indices = np.argsort(scores)[-TOP_K:][::-1]
-    top_paths = []
-    for rank, idx in enumerate(top_indices, 1):
-        fname = os.path.join(frames_folder, f"{fecha_prefix}_top_{rank:02d}.jpg")
-        cv2.imwrite(fname, imgs_color[idx], [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
-        top_paths.append(fname)
-    
-    # 7. Generar máscara (usando la mejor imagen)
-    best_idx = top_indices[0]
-    best_img = imgs_gray[best_idx].astype(np.float32)
-    diff = np.abs(best_img - avg.astype(np.float32))
-    diff = diff - MASK_OFFSET
-    diff[diff < 0] = 0
-    if diff.size > 0:
-        umbral = np.percentile(diff.flatten(), 100 * (1 - MASK_SATURATED))
-        diff = np.clip(diff * 255 / max(umbral, 1), 0, 255)
-    mask_gray = diff.astype(np.uint8)
-    mask_small = cv2.resize(mask_gray, (mask_gray.shape[1] // 4, mask_gray.shape[0] // 4))
-    mask_path = os.path.join(frames_folder, f"{fecha_prefix}_mask.jpg")
-    cv2.imwrite(mask_path, mask_small, [int(cv2.IMWRITE_JPEG_QUALITY), MASK_QUALITY])
+    with ImageSequenceSource(copied_paths) as fuente:
+        avg, top_items = puntuar_rafaga(fuente, etapas=etapas)
+    etapas.sumar_bytes("images", sum(os.path.getsize(p) for p in copied_paths if os.path.exists(p)))
+    with etapas.medir("mask"):
+        mascara = mascara_rafaga(top_items[0][2], avg)
+    promedio_path, top_paths, mask_path = guardar_salidas(
+        frames_folder, fecha_prefix, avg,
+        [item[2] for item in top_items], [item[3] for item in top_items], etapas, mascara=mascara
+    )
     
     # 8. Metadatos (misma estructura que videos)
     try:
@@ -579,6 +1580,7 @@ def procesar_grupo_de_fotos(grupo, output_root):
         "operator": "",
         "session_id": "",
         "is_photo": True,                    # campo adicional (opcional para Tagger)
-        "is_burst": len(grupo) > 1
+        "is_burst": len(grupo) > 1,
+        **etapas.como_dict()
     }
 # →→→ FIN NUEVA FUNCIÓN
\ No newline at end of file
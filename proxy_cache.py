@@ -0,0 +1,92 @@
+# proxy_cache.py
+"""
+Caché de proxies: frames gris reducidos de cada video (uno por muestra a FPS_EXTRACT),
+guardados como uint8 crudo en output/cache/proxies/<hash>.u8 con su descriptor <hash>.json.
+Se abren memory-mapped para volver a puntuar (rescore.py) sin decodificar el video.
+"""
+import os
+import json
+import numpy as np
+import cv2
+
+# 2: muestras de filtro_fps (último frame en o antes de cada segundo), no el más cercano
+PROXY_CACHE_VERSION = 2
+
+
+def get_proxy_dir(output_root):
+    return os.path.join(output_root, "cache", "proxies")
+
+
+def _rutas(output_root, v_hash):
+    base = os.path.join(get_proxy_dir(output_root), v_hash)
+    return base + ".u8", base + ".json"
+
+
+class ProxyWriter:
+    """
+    Escribe frames gris de tamaño `size=(w, h)` en secuencia; el archivo solo se publica
+    (rename atómico) en finalizar(), así un proceso cortado no deja proxies a medias.
+    """
+
+    def __init__(self, output_root, v_hash, size, fps, source_dims):
+        os.makedirs(get_proxy_dir(output_root), exist_ok=True)
+        self.data_path, self.meta_path = _rutas(output_root, v_hash)
+        self.tmp_path = self.data_path + ".tmp"
+        self.size = size
+        self.shape = (size[1], size[0])
+        self.fps = fps
+        self.source_dims = source_dims
+        self.count = 0
+        self._buf = np.empty(self.shape, dtype=np.uint8)
+        self._f = open(self.tmp_path, "wb")
+
+    def agregar(self, frame):
+        if frame.shape != self.shape:
+            cv2.resize(frame, self.size, dst=self._buf, interpolation=cv2.INTER_AREA)
+            frame = self._buf
+        self._f.write(np.ascontiguousarray(frame).data)
+        self.count += 1
+
+    def finalizar(self):
+        self._f.close()
+        if self.count == 0:
+            os.remove(self.tmp_path)
+            return
+        os.replace(self.tmp_path, self.data_path)
+        meta = {
+            "version": PROXY_CACHE_VERSION,
+            "frames": self.count,
+            "width": self.size[0],
+            "height": self.size[1],
+            "fps": self.fps,
+            "source_width": self.source_dims[0],
+            "source_height": self.source_dims[1]
+        }
+        tmp_meta = self.meta_path + ".tmp"
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, self.meta_path)
+
+    def descartar(self):
+        self._f.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def abrir_proxy(output_root, v_hash):
+    """Devuelve (frames memory-mapped (N, h, w) uint8, descriptor) o None si no hay proxy válido."""
+    data_path, meta_path = _rutas(output_root, v_hash)
+    if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != PROXY_CACHE_VERSION:
+            return None
+        shape = (meta["frames"], meta["height"], meta["width"])
+        if os.path.getsize(data_path) != int(np.prod(shape)):
+            return None
+        return np.memmap(data_path, dtype=np.uint8, mode="r", shape=shape), meta
+    except Exception as e:
+        print(f"Advertencia: proxy ilegible para {v_hash}, se ignora: {e}")
+        return None
@@ -0,0 +1,144 @@
+# rescore.py
+"""
+Re-puntúa desde la caché de proxies (Processing.PROXY_CACHE) todos los videos ya procesados,
+en paralelo y sin decodificar los videos: puntajes, elección de tops y línea de tiempo salen
+del proxy. Las imágenes siguen a resolución completa: el video original solo se abre si
+cambiaron los tops o el fondo (una búsqueda por top y la ventana final del fondo).
+Los parámetros por defecto son los de [Processing] (BUFFER_N, TOP_K, DOWNSAMPLE_MAX), y se
+pueden cambiar por línea de comandos para barrer valores sin tocar el código.
+
+Uso: python rescore.py [--session SESSION_ID] [--procesos N]
+                       [--buffer-n N] [--top-k K] [--downsample-max PX]
+Actualiza los metadata.json de las sesiones, el consolidado (solo los campos de salida) y
+las salidas registradas en el índice de huellas (output/cache/fingerprints.json).
+"""
+import os
+import json
+import time
+import argparse
+from multiprocessing import Pool, cpu_count
+
+from config_utils import load_config
+from procesamiento import wrapper_rescore, BUFFER_N, TOP_K, DOWNSAMPLE_MAX
+from scan_utils import load_fingerprint_index, save_fingerprint_index
+from utils import metadata_lock
+
+# Campos que cambia el re-puntuado; el resto de la entrada (tags, notas...) no se toca
+CAMPOS_RESCORE = [
+    "promedio", "mask", "tops", "top_timestamps", "motion", "motion_summary", "frames",
+    "score_params", "rescore_time_sec"
+]
+
+
+def _leer_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _escribir_json(path, data):
+    tmp_path = path + ".tmp"
+    with metadata_lock:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def _aplicar(entradas, nuevos):
+    """Copia los CAMPOS_RESCORE de `nuevos` ({hash: entrada}) a las entradas. Devuelve cuántas cambió."""
+    cambios = 0
+    for e in entradas:
+        nuevo = nuevos.get(e.get("video_hash"))
+        if nuevo is None:
+            continue
+        for campo in CAMPOS_RESCORE:
+            if campo in nuevo:
+                e[campo] = nuevo[campo]
+        cambios += 1
+    return cambios
+
+
+def _actualizar_indice(output_root, nuevos):
+    """Las huellas de los videos re-puntuados apuntan a sus nuevas salidas (escanear_videos las reutiliza)."""
+    indice = load_fingerprint_index(output_root)
+    cambios = 0
+    for huella in indice.values():
+        nuevo = nuevos.get(huella.get("hash"))
+        if nuevo is not None and huella.get("artifacts"):
+            huella["artifacts"] = {"promedio": nuevo["promedio"], "mask": nuevo["mask"], "tops": list(nuevo["tops"])}
+            cambios += 1
+    if cambios:
+        save_fingerprint_index(indice, output_root)
+
+
+def rescore(output_root, session_id=None, procesos=None, buffer_n=BUFFER_N, top_k=TOP_K,
+            downsample_max=DOWNSAMPLE_MAX):
+    sessions_dir = os.path.join(output_root, "sessions")
+    if not os.path.isdir(sessions_dir):
+        print(f"[rescore] No existe la carpeta de sesiones: {sessions_dir}")
+        return {}
+
+    sesiones = {}
+    for sid in sorted(os.listdir(sessions_dir)):
+        if session_id and sid != session_id:
+            continue
+        path = os.path.join(sessions_dir, sid, "metadata.json")
+        if os.path.exists(path):
+            try:
+                sesiones[path] = _leer_json(path)
+            except Exception as e:
+                print(f"[rescore] Error leyendo {path}: {e}")
+
+    # Un trabajo por video (el mismo hash puede aparecer en varias sesiones)
+    pendientes = {}
+    for entradas in sesiones.values():
+        for e in entradas:
+            if e.get("status") == "done" and not e.get("is_photo") and e.get("video_hash"):
+                pendientes.setdefault(e["video_hash"], dict(e))
+
+    t0 = time.time()
+    nuevos = {}
+    fallos = {"sin proxy": 0, "sin video": 0, "error": 0}
+    # Los parámetros viajan con cada trabajo: en Windows los procesos del Pool no heredan el estado
+    parametros = {"buffer_n": buffer_n, "top_k": top_k, "downsample_max": downsample_max}
+    args_list = [(e, output_root, parametros) for e in pendientes.values()]
+    num_proc = max(1, procesos or cpu_count() - 1)
+    with Pool(num_proc) as pool:
+        for res, motivo in pool.imap_unordered(wrapper_rescore, args_list):
+            if motivo is None:
+                nuevos[res["video_hash"]] = res
+            else:
+                fallos[motivo] += 1
+    print(f"[rescore] {len(nuevos)} videos re-puntuados (buffer_n={buffer_n}, top_k={top_k}, "
+          f"downsample_max={downsample_max}); {fallos['sin proxy']} sin proxy, "
+          f"{fallos['sin video']} sin video original, {fallos['error']} con error; "
+          f"{time.time() - t0:.1f} s con {num_proc} procesos")
+
+    for path, entradas in sesiones.items():
+        if _aplicar(entradas, nuevos):
+            _escribir_json(path, entradas)
+
+    if nuevos:
+        _actualizar_indice(output_root, nuevos)
+
+    consolidated_path = os.path.join(output_root, "consolidated", "all_sessions_metadata.json")
+    if nuevos and os.path.exists(consolidated_path):
+        consolidado = _leer_json(consolidated_path)
+        if _aplicar(consolidado, nuevos):
+            _escribir_json(consolidated_path, consolidado)
+    return nuevos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-puntúa videos desde la caché de proxies.")
+    parser.add_argument("--session", help="Solo esta sesión (session_id)")
+    parser.add_argument("--procesos", type=int, help="Procesos en paralelo (por defecto: núcleos - 1)")
+    parser.add_argument("--buffer-n", type=int, default=BUFFER_N,
+                        help=f"Frames de la ventana del fondo (por defecto: {BUFFER_N})")
+    parser.add_argument("--top-k", type=int, default=TOP_K, help=f"Tops por video (por defecto: {TOP_K})")
+    parser.add_argument("--downsample-max", type=int, default=DOWNSAMPLE_MAX,
+                        help=f"Lado máximo para puntuar, en píxeles (por defecto: {DOWNSAMPLE_MAX})")
+    args = parser.parse_args()
+
+    config = load_config()
+    output_root = config["General"]["output_folder"]
+    rescore(output_root, args.session, args.procesos, args.buffer_n, args.top_k, args.downsample_max)
@@ -0,0 +1,133 @@
+# scan_utils.py
+"""
+Escaneo de la carpeta de entrada en una sola pasada con os.scandir.
+Recorre todo el árbol de la tarjeta (DCIM/100MEDIA, DCIM/101MEDIA, ...), clasifica por
+extensión en minúsculas y conserva el stat de cada archivo para reutilizarlo en el hash,
+el sondeo (cache_key) y la asociación por fecha sin volver a consultar el disco.
+
+Índice de huellas (output/cache/fingerprints.json): (ruta, tamaño, mtime_ns, inodo) ->
+(hash, fecha_prefix, artefactos, status), para que re-escanear una tarjeta sin cambios
+sea solo una pasada de stat.
+"""
+import os
+import json
+import threading
+
+VIDEO_EXTS = {".avi", ".mp4", ".mov", ".mkv"}
+IMAGE_EXTS = {".jpg", ".jpeg", ".png"}
+
+FINGERPRINT_INDEX_VERSION = 1
+_index_lock = threading.Lock()
+# En Windows DirEntry.stat() trae st_ino 0 y os.stat el inodo real: allí la clave de huella
+# no lo usa, para que no dependa de cómo se obtuvo el stat (escaneo o staging)
+_CLAVE_CON_INODO = os.name != "nt"
+
+
+class ArchivoEscaneado:
+    """Ruta de un archivo con el os.stat_result que se obtuvo al escanear."""
+    __slots__ = ("path", "stat")
+
+    def __init__(self, path, stat):
+        self.path = path
+        self.stat = stat
+
+    @property
+    def size(self):
+        return self.stat.st_size
+
+    @property
+    def mtime(self):
+        return self.stat.st_mtime
+
+    def __repr__(self):
+        return f"ArchivoEscaneado({self.path!r}, size={self.size})"
+
+
+def _normalizar(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def escanear_carpeta(carpeta, recursivo=True, excluir=()):
+    """
+    Devuelve (videos, imagenes): listas de ArchivoEscaneado ordenadas por ruta.
+    Como glob, ignora archivos y carpetas ocultos (".Trashes", "._VID.MP4" de macOS...).
+    Las subcarpetas que no se pueden leer se avisan y se saltan, igual que las de `excluir`
+    (p. ej. la carpeta de salida cuando está dentro de la de entrada: sus tops no son fotos).
+    """
+    excluidas = {_normalizar(p) for p in excluir if p}
+    videos, imagenes = [], []
+    pendientes = [carpeta]
+    while pendientes:
+        actual = pendientes.pop()
+        try:
+            with os.scandir(actual) as it:
+                entradas = list(it)
+        except OSError as e:
+            print(f"Advertencia: no se pudo leer la carpeta {actual}: {e}")
+            continue
+        for entry in entradas:
+            if entry.name.startswith("."):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursivo and _normalizar(entry.path) not in excluidas:
+                        pendientes.append(entry.path)
+                    continue
+                ext = os.path.splitext(entry.name)[1].lower()
+                if ext in VIDEO_EXTS:
+                    destino = videos
+                elif ext in IMAGE_EXTS:
+                    destino = imagenes
+                else:
+                    continue
+                if not entry.is_file():
+                    continue
+                destino.append(ArchivoEscaneado(entry.path, entry.stat()))
+            except OSError as e:
+                print(f"Advertencia: no se pudo leer {entry.path}: {e}")
+    videos.sort(key=lambda a: a.path)
+    imagenes.sort(key=lambda a: a.path)
+    return videos, imagenes
+
+
+# ---------------------------
+# Índice persistente de huellas
+# ---------------------------
+def get_fingerprint_index_path(output_root):
+    return os.path.join(output_root, "cache", "fingerprints.json")
+
+
+def clave_huella(path, stat):
+    """
+    Clave (ruta, tamaño, mtime_ns, inodo): si el archivo cambia o se reemplaza, deja de coincidir.
+    Sin inodo donde el stat del escaneo no lo trae (Windows) o vale 0.
+    """
+    clave = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    if _CLAVE_CON_INODO and stat.st_ino:
+        clave += f"|{stat.st_ino}"
+    return clave
+
+
+def load_fingerprint_index(output_root):
+    path = get_fingerprint_index_path(output_root)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != FINGERPRINT_INDEX_VERSION:
+            return {}
+        return data.get("entries", {})
+    except Exception as e:
+        print(f"Advertencia: índice de huellas ilegible, se ignora ({path}): {e}")
+        return {}
+
+
+def save_fingerprint_index(index, output_root):
+    path = get_fingerprint_index_path(output_root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with _index_lock:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": FINGERPRINT_INDEX_VERSION, "entries": index}, f)
+        os.replace(tmp_path, path)
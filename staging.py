@@ -0,0 +1,214 @@
+# staging.py
+"""
+Copia de la tarjeta a disco local (Processing.STAGING_FOLDER) antes de procesar.
+- Cada archivo se lee de la tarjeta UNA sola vez: durante la copia se calculan el hash de
+  compute_video_hash (muestras de inicio y fin) y el sha256 completo del manifiesto.
+- El hash de cada video queda en `huellas` con la clave del stat de la copia; pasado a
+  escanear_videos(huellas=...) evita volver a leerlo.
+- Las fotos se copian primero (son chicas y hacen falta para asociarlas a los videos); cada
+  video se entrega al procesamiento (al_copiar_video) apenas termina su copia, de modo que
+  copia, hash y decodificación se solapan.
+- Manifiesto (staging_manifest.json en la carpeta de destino): origen, destino, tamaño,
+  mtime, sha256 y si la copia releída coincide. Una copia ya verificada no se repite.
+Usado por: gui_inicial.py.
+"""
+import os
+import json
+import shutil
+import hashlib
+from datetime import datetime
+
+from scan_utils import escanear_carpeta, clave_huella
+
+MANIFEST_NAME = "staging_manifest.json"
+CHUNK_SIZE = 4 * 1024 * 1024
+# El manifiesto se reescribe cada tantos archivos (y al final), no tras cada uno
+MANIFEST_EVERY = 25
+
+
+class HashEnVuelo:
+    """
+    Hashes de los bytes que pasan por la copia: sha256 completo y las muestras de
+    compute_video_hash (primer y último `sample_size`), con el mismo resultado que este.
+    """
+
+    def __init__(self, sample_size=1024*1024, length=16):
+        self.sample_size = sample_size
+        self.length = length
+        self.sha256 = hashlib.sha256()
+        self.inicio = bytearray()
+        self.cola = bytearray()
+        self.total = 0
+
+    def agregar(self, data):
+        self.sha256.update(data)
+        if len(self.inicio) < self.sample_size:
+            self.inicio += data[:self.sample_size - len(self.inicio)]
+        self.cola += data
+        if len(self.cola) > self.sample_size:
+            del self.cola[:len(self.cola) - self.sample_size]
+        self.total += len(data)
+
+    def hash_video(self):
+        if self.total == 0:
+            return "empty_file"
+        hasher = hashlib.sha256()
+        hasher.update(self.inicio)
+        if self.total > self.sample_size:
+            hasher.update(self.cola)
+        return hasher.hexdigest()[:self.length]
+
+
+def _sha256_archivo(path, buf):
+    sha = hashlib.sha256()
+    view = memoryview(buf)
+    with open(path, "rb") as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            sha.update(view[:n])
+    return sha.hexdigest()
+
+
+class CopiaTarjeta:
+    """Copia `origen` a `destino` conservando el árbol de carpetas y las fechas de modificación."""
+
+    def __init__(self, origen, destino, verificar=True, excluir=()):
+        self.origen = origen
+        self.destino = destino
+        # Carpetas dentro de `origen` que no se copian (la de salida); destino nunca
+        self.excluir = (destino,) + tuple(excluir)
+        self.verificar = verificar
+        self.manifest_path = os.path.join(destino, MANIFEST_NAME)
+        self.manifiesto = self._cargar_manifiesto()
+        # Entradas para el índice de huellas de los videos copiados: {clave: {"hash", "status"}}
+        self.huellas = {}
+        self._buf = bytearray(CHUNK_SIZE)
+
+    def _cargar_manifiesto(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return {e["source"]: e for e in json.load(f).get("files", [])}
+        except Exception as e:
+            print(f"Advertencia: manifiesto de copia ilegible, se rehace ({self.manifest_path}): {e}")
+            return {}
+
+    def guardar_manifiesto(self):
+        os.makedirs(self.destino, exist_ok=True)
+        archivos = sorted(self.manifiesto.values(), key=lambda e: e["source"])
+        data = {
+            "origin": os.path.abspath(self.origen),
+            "updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "files": archivos,
+            "total_bytes": sum(e["size"] for e in archivos),
+            "all_verified": all(e.get("verified") for e in archivos)
+        }
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _ya_copiado(self, archivo, rel, dst):
+        """Copia previa verificada del mismo archivo de origen (mismo tamaño y mtime)."""
+        e = self.manifiesto.get(rel)
+        if not e or not e.get("verified") or not os.path.exists(dst):
+            return False
+        st = os.stat(dst)
+        return (e["size"] == archivo.size == st.st_size
+                and e["mtime_ns"] == archivo.stat.st_mtime_ns == st.st_mtime_ns)
+
+    def copiar_archivo(self, archivo):
+        """
+        Copia un archivo (ArchivoEscaneado del origen) leyéndolo una sola vez.
+        Devuelve (ruta de destino, entrada del manifiesto).
+        """
+        rel = os.path.relpath(archivo.path, self.origen)
+        dst = os.path.join(self.destino, rel)
+        if self._ya_copiado(archivo, rel, dst):
+            return dst, self.manifiesto[rel]
+
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp_path = dst + ".tmp"
+        hasher = HashEnVuelo()
+        view = memoryview(self._buf)
+        with open(archivo.path, "rb") as fsrc, open(tmp_path, "wb") as fdst:
+            while True:
+                n = fsrc.readinto(self._buf)
+                if not n:
+                    break
+                hasher.agregar(view[:n])
+                fdst.write(view[:n])
+            fdst.flush()
+            os.fsync(fdst.fileno())
+        # Misma fecha de modificación: la asociación de fotos y la fecha de respaldo la usan
+        shutil.copystat(archivo.path, tmp_path)
+        os.replace(tmp_path, dst)
+
+        sha256 = hasher.sha256.hexdigest()
+        entrada = {
+            "source": rel,
+            "dest": dst,
+            "size": hasher.total,
+            "mtime_ns": archivo.stat.st_mtime_ns,
+            "sha256": sha256,
+            "video_hash": hasher.hash_video(),
+            # La copia se relee del disco local (no de la tarjeta) y se compara
+            "verified": (hasher.total == archivo.size and
+                         (not self.verificar or _sha256_archivo(dst, self._buf) == sha256))
+        }
+        if not entrada["verified"]:
+            print(f"Advertencia: la copia de {rel} no coincide con el origen")
+        self.manifiesto[rel] = entrada
+        return dst, entrada
+
+    def copiar(self, al_copiar_video=None, progreso=None):
+        """
+        Copia fotos y luego videos. Llama a al_copiar_video(ruta_destino) al terminar cada
+        video y a progreso(hechos, total) tras cada archivo. Devuelve la lista de videos copiados.
+        """
+        videos, imagenes = escanear_carpeta(self.origen, excluir=self.excluir)
+        os.makedirs(self.destino, exist_ok=True)
+        total_bytes = sum(
+            a.size for a in videos + imagenes
+            if not self._ya_copiado(a, os.path.relpath(a.path, self.origen),
+                                    os.path.join(self.destino, os.path.relpath(a.path, self.origen)))
+        )
+        libre = shutil.disk_usage(self.destino).free
+        if libre < total_bytes:
+            raise IOError(f"Espacio insuficiente en {self.destino}: "
+                          f"{total_bytes / 1e9:.1f} GB necesarios, {libre / 1e9:.1f} GB libres")
+
+        total = len(videos) + len(imagenes)
+        hechos = 0
+        copiados = []
+        try:
+            for archivo in imagenes:
+                self.copiar_archivo(archivo)
+                hechos += 1
+                if progreso is not None:
+                    progreso(hechos, total)
+                if hechos % MANIFEST_EVERY == 0:
+                    self.guardar_manifiesto()
+            self.guardar_manifiesto()
+
+            for archivo in videos:
+                dst, entrada = self.copiar_archivo(archivo)
+                # Hash ya calculado en vuelo: escanear_videos lo toma de aquí sin releer el video
+                if entrada["verified"]:
+                    self.huellas[clave_huella(dst, os.stat(dst))] = {
+                        "hash": entrada["video_hash"], "status": "pending"
+                    }
+                copiados.append(dst)
+                hechos += 1
+                if progreso is not None:
+                    progreso(hechos, total)
+                if hechos % MANIFEST_EVERY == 0:
+                    self.guardar_manifiesto()
+                if al_copiar_video is not None:
+                    al_copiar_video(dst)
+        finally:
+            self.guardar_manifiesto()
+        return copiados
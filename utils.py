@@ -1,4 +1,5 @@
-import threading, os, platform, subprocess
+import threading, os, platform, subprocess, time
+from contextlib import contextmanager
 
 metadata_lock = threading.Lock()
 
@@ -12,3 +13,35 @@ def open_video_default(video_path):
         os.startfile(video_path)
     else:
         subprocess.call(("xdg-open", video_path))
+
+
+class Etapas:
+    """
+    Tiempos por etapa (segundos acumulados) y bytes leídos durante el procesamiento de un
+    video o ráfaga. como_dict() da lo que se guarda en los metadatos ("timings", "bytes_read").
+    """
+
+    def __init__(self):
+        self.segundos = {}
+        self.bytes = {}
+        self.pipeline = None
+
+    def sumar(self, etapa, segundos):
+        self.segundos[etapa] = self.segundos.get(etapa, 0.0) + segundos
+
+    def sumar_bytes(self, origen, n):
+        self.bytes[origen] = self.bytes.get(origen, 0) + int(n)
+
+    @contextmanager
+    def medir(self, etapa):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sumar(etapa, time.perf_counter() - t)
+
+    def como_dict(self):
+        return {
+            "timings": {k: round(v, 3) for k, v in self.segundos.items()},
+            "bytes_read": dict(self.bytes)
+        }